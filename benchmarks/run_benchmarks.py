@@ -0,0 +1,214 @@
+# -*- coding: utf-8
+
+"""Benchmarks of PaDEL_pywrapper.
+
+Each case is run in a fresh Python process so that peak memory usage and JVM launches are measured in isolation.
+Molecules are generated from a fixed seed, so that results are reproducible without network access.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 10 100 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 10 100 --output new.json --compare results.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Fragments concatenated into synthetic molecules
+FRAGMENTS = ['C', 'CC', 'CCC', 'O', 'N', 'C(=O)O', 'C(=O)N', 'C(F)(F)F', 'Cl', 'S(=O)(=O)N',
+             'c1ccccc1', 'c1ccncc1', 'C1CCNCC1', 'C1CCCCC1', 'c1ccc2ccccc2c1']
+
+
+def synthetic_molecules(n: int, max_fragments: int = 8, seed: int = 1234, embed: bool = False) -> list:
+    """Generate reproducible drug-like molecules of varying size.
+
+    :param n: number of molecules
+    :param max_fragments: maximum number of fragments making a molecule
+    :param seed: seed of the random number generator
+    :param embed: if True, generate 3D coordinates
+    :return: RDKit molecules with explicit hydrogen atoms
+    """
+    from rdkit import Chem, RDLogger
+    from rdkit.Chem import AllChem
+
+    # Invalid combinations of fragments are expected
+    RDLogger.DisableLog('rdApp.*')
+    rng = random.Random(seed)
+    mols = []
+    while len(mols) < n:
+        smiles = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, max_fragments)))
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            continue
+        mol = Chem.AddHs(mol)
+        if embed and AllChem.EmbedMolecule(mol, randomSeed=seed) != 0:
+            continue
+        mols.append(mol)
+    return mols
+
+
+def get_cases(sizes: List[int], njobs: List[int], chunksizes: List[int]) -> List[Dict]:
+    """Enumerate benchmark cases.
+
+    :param sizes: numbers of molecules
+    :param njobs: numbers of processes of the parallel sweep
+    :param chunksizes: chunk sizes of the parallel sweep
+    """
+    from PaDEL_pywrapper.descriptor import _fingerprints
+
+    cases = []
+    for size in sizes:
+        cases.append({'name': '2D descriptors', 'descriptors': '2D', 'size': size})
+        cases.append({'name': '3D descriptors', 'descriptors': '3D', 'size': size})
+        for fp in _fingerprints:
+            cases.append({'name': fp.name, 'descriptors': fp.name, 'size': size})
+        for jobs in njobs:
+            for chunksize in chunksizes:
+                cases.append({'name': f'2D descriptors (njobs={jobs}, chunksize={chunksize})', 'descriptors': '2D',
+                              'size': size, 'njobs': jobs, 'chunksize': chunksize})
+    return cases
+
+
+def run_case(case: Dict, repeats: int, seed: int) -> Dict:
+    """Time a benchmark case in the current process.
+
+    :param case: descriptors, number of molecules and parameters of the calculation
+    :param repeats: number of timed calls
+    :param seed: seed of the generation of molecules
+    """
+    from PaDEL_pywrapper import PaDEL, padel_wrapper
+    from PaDEL_pywrapper.descriptor import _fingerprints, descriptors
+
+    # Count JVM launches, including those of forked worker processes
+    launches = tempfile.mkstemp(suffix='_launches.log')
+    os.close(launches[0])
+
+    class CountingPopen(subprocess.Popen):
+        def __init__(self, args, *pargs, **kwargs):
+            if os.path.basename(str(args[0])).split('.')[0] == 'java':
+                with open(launches[1], 'a') as log:
+                    log.write('1\n')
+            super().__init__(args, *pargs, **kwargs)
+
+    padel_wrapper.Popen = CountingPopen
+    try:
+        from PaDEL_pywrapper import server
+        server.Popen = CountingPopen
+    except ImportError:
+        # Versions without persistent ePaDEL servers
+        pass
+
+    is_3D = case['descriptors'] == '3D'
+    mols = synthetic_molecules(case['size'], seed=seed, embed=is_3D)
+    if case['descriptors'] == '2D':
+        padel = PaDEL([desc for desc in descriptors if not desc.is_3D])
+    elif is_3D:
+        padel = PaDEL([desc for desc in descriptors if desc.is_3D], ignore_3D=False)
+    else:
+        padel = PaDEL([fp for fp in _fingerprints if fp.name == case['descriptors']])
+    kwargs = {'njobs': case.get('njobs', 1), 'chunksize': case.get('chunksize', 100)}
+    # Warm up (e.g. installation of Java, names of descriptors)
+    padel.calculate(mols[:1], show_banner=False)
+    with open(launches[1], 'w'):
+        pass
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        padel.calculate(mols, show_banner=False, **kwargs)
+        times.append(time.perf_counter() - start)
+    with open(launches[1]) as log:
+        n_launches = len(log.readlines())
+    os.remove(launches[1])
+    # Maximum resident set sizes are in kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    latency = statistics.median(times)
+    return {**case,
+            'repeats': repeats,
+            'times': times,
+            'latency': latency,
+            'molecules_per_second': case['size'] / latency,
+            'jvm_launches': n_launches / repeats,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2,
+            'peak_rss_children_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2}
+
+
+def get_metadata() -> Dict:
+    """Describe the environment of the benchmarks."""
+    import PaDEL_pywrapper
+
+    # Located as in all versions, for results to be compared
+    with open(os.path.join(os.path.dirname(PaDEL_pywrapper.__file__), 'PaDEL-Descriptor', 'lib', 'ePaDEL.jar'),
+              'rb') as handle:
+        epadel = hashlib.sha256(handle.read()).hexdigest()
+    return {'version': PaDEL_pywrapper.__version__,
+            'epadel': epadel,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'date': datetime.now(timezone.utc).isoformat()}
+
+
+def compare(results: List[Dict], reference: List[Dict]) -> None:
+    """Print the speedup of each case relative to reference results.
+
+    :param results: results of the benchmarks
+    :param reference: results of the same benchmarks obtained with another version
+    """
+    reference = {(case['name'], case['size']): case for case in reference}
+    print(f'{"case":<60} {"size":>6} {"speedup":>8} {"JVM launches":>14}')
+    for case in results:
+        previous = reference.get((case['name'], case['size']))
+        if previous is None:
+            continue
+        print(f'{case["name"]:<60} {case["size"]:>6} {previous["latency"] / case["latency"]:>8.2f} '
+              f'{previous["jvm_launches"]:>6.1f} -> {case["jvm_launches"]:<5.1f}')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100], help='numbers of molecules')
+    parser.add_argument('--njobs', type=int, nargs='+', default=[1, 2, 4], help='numbers of processes to sweep')
+    parser.add_argument('--chunksizes', type=int, nargs='+', default=[10, 50], help='chunk sizes to sweep')
+    parser.add_argument('--repeats', type=int, default=3, help='number of timed calls of each case')
+    parser.add_argument('--seed', type=int, default=1234, help='seed of the generation of molecules')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--output', default='benchmarks.json', help='path of the JSON file of results')
+    parser.add_argument('--compare', help='path of a JSON file of results to compare to')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    # Run a single case in this process
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case), args.repeats, args.seed)))
+        return
+    results = []
+    for case in get_cases(args.sizes, args.njobs, args.chunksizes):
+        if args.filter not in case['name']:
+            continue
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case),
+                                 '--repeats', str(args.repeats), '--seed', str(args.seed)],
+                                stdout=subprocess.PIPE, check=True).stdout
+        result = json.loads(output.decode().splitlines()[-1])
+        print(f'{result["name"]:<60} {result["size"]:>6} molecules: {result["molecules_per_second"]:>9.1f} mol/s, '
+              f'{result["jvm_launches"]:.1f} JVM launches, {result["peak_rss_children_mb"]:.0f} MB peak RSS (children)')
+        results.append(result)
+    with open(args.output, 'w') as handle:
+        json.dump({'metadata': get_metadata(), 'results': results}, handle, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as handle:
+            compare(results, json.load(handle)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,537 @@
+package epadel;
+
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.Arrays;
+import java.util.Map;
+import java.util.concurrent.Callable;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+
+import org.apache.commons.cli.CommandLine;
+
+import org.openscience.cdk.DefaultChemObjectBuilder;
+import org.openscience.cdk.interfaces.IAtomContainer;
+import org.openscience.cdk.smiles.SmilesParser;
+
+import libpadeldescriptor.CDK_Descriptor;
+import libpadeldescriptor.CDK_AcidicGroupCountDescriptor;
+import libpadeldescriptor.CDK_ALOGPDescriptor;
+import libpadeldescriptor.CDK_APolDescriptor;
+import libpadeldescriptor.CDK_AromaticAtomsCountDescriptor;
+import libpadeldescriptor.CDK_AromaticBondsCountDescriptor;
+import libpadeldescriptor.CDK_AtomCountDescriptor;
+import libpadeldescriptor.CDK_HeavyAtomCountDescriptor;
+import libpadeldescriptor.CDK_HalogenCountDescriptor;
+import libpadeldescriptor.CDK_AutocorrelationDescriptor;
+import libpadeldescriptor.CDK_BaryszMatrixDescriptor;
+import libpadeldescriptor.CDK_BasicGroupCountDescriptor;
+import libpadeldescriptor.CDK_BCUTDescriptor;
+import libpadeldescriptor.CDK_BondCountDescriptor;
+import libpadeldescriptor.CDK_BPolDescriptor;
+import libpadeldescriptor.CDK_BurdenModifiedEigenvaluesDescriptor;
+import libpadeldescriptor.CDK_CarbonTypesDescriptor;
+import libpadeldescriptor.CDK_ChiChainDescriptor;
+import libpadeldescriptor.CDK_ChiClusterDescriptor;
+import libpadeldescriptor.CDK_ChiPathClusterDescriptor;
+import libpadeldescriptor.CDK_ChiPathDescriptor;
+import libpadeldescriptor.CDK_ConstitutionalDescriptor;
+import libpadeldescriptor.CDK_CrippenDescriptor;
+import libpadeldescriptor.CDK_DetourMatrixDescriptor;
+import libpadeldescriptor.CDK_EccentricConnectivityIndexDescriptor;
+import libpadeldescriptor.CDK_EStateAtomTypeDescriptor;
+import libpadeldescriptor.CDK_ExtendedTopochemicalAtomDescriptor;
+import libpadeldescriptor.CDK_FMFDescriptor;
+import libpadeldescriptor.CDK_FragmentComplexityDescriptor;
+import libpadeldescriptor.CDK_HBondAcceptorCountDescriptor;
+import libpadeldescriptor.CDK_HBondDonorCountDescriptor;
+import libpadeldescriptor.CDK_HybridizationRatioDescriptor;
+import libpadeldescriptor.CDK_InformationContentDescriptor;
+import libpadeldescriptor.CDK_KappaShapeIndicesDescriptor;
+import libpadeldescriptor.CDK_LargestChainDescriptor;
+import libpadeldescriptor.CDK_LargestPiSystemDescriptor;
+import libpadeldescriptor.CDK_LongestAliphaticChainDescriptor;
+import libpadeldescriptor.CDK_MannholdLogPDescriptor;
+import libpadeldescriptor.CDK_McGowanVolumeDescriptor;
+import libpadeldescriptor.CDK_MDEDescriptor;
+import libpadeldescriptor.CDK_MLFERDescriptor;
+import libpadeldescriptor.CDK_PathCountDescriptor;
+import libpadeldescriptor.CDK_PetitjeanNumberDescriptor;
+import libpadeldescriptor.CDK_RingCountDescriptor;
+import libpadeldescriptor.CDK_RotatableBondsCountDescriptor;
+import libpadeldescriptor.CDK_RuleOfFiveDescriptor;
+import libpadeldescriptor.CDK_TopologicalDescriptor;
+import libpadeldescriptor.CDK_TopologicalChargeDescriptor;
+import libpadeldescriptor.CDK_TopologicalDistanceMatrixDescriptor;
+import libpadeldescriptor.CDK_TPSADescriptor;
+import libpadeldescriptor.CDK_VABCDescriptor;
+import libpadeldescriptor.CDK_VAdjMaDescriptor;
+import libpadeldescriptor.CDK_WalkCountDescriptor;
+import libpadeldescriptor.CDK_WeightDescriptor;
+import libpadeldescriptor.CDK_WeightedPathDescriptor;
+import libpadeldescriptor.CDK_WienerNumbersDescriptor;
+import libpadeldescriptor.CDK_XLogPDescriptor;
+import libpadeldescriptor.CDK_ZagrebIndexDescriptor;
+import libpadeldescriptor.CDK_Autocorrelation3DDescriptor;
+import libpadeldescriptor.CDK_CPSADescriptor;
+import libpadeldescriptor.CDK_GravitationalIndexDescriptor;
+import libpadeldescriptor.CDK_LengthOverBreadthDescriptor;
+import libpadeldescriptor.CDK_MomentOfInertiaDescriptor;
+import libpadeldescriptor.CDK_PetitjeanShapeIndexDescriptor;
+import libpadeldescriptor.CDK_RDFDescriptor;
+import libpadeldescriptor.CDK_WHIMDescriptor;
+import extendedlibpadeldescriptor.eCDK_IFingerprint;
+import extendedlibpadeldescriptor.eCDK_Fingerprinter;
+import extendedlibpadeldescriptor.eCDK_ExtendedFingerprinter;
+import extendedlibpadeldescriptor.eCDK_EStateFingerprinter;
+import extendedlibpadeldescriptor.eCDK_GraphOnlyFingerprinter;
+import extendedlibpadeldescriptor.eCDK_MACCSFingerprinter;
+import extendedlibpadeldescriptor.eCDK_PubchemFingerprinter;
+import extendedlibpadeldescriptor.eCDK_SubstructureFingerprinter;
+import extendedlibpadeldescriptor.eCDK_KlekotaRothFingerprinter;
+import extendedlibpadeldescriptor.eCDK_AtomPairs2DFingerprinter;
+import extendedlibpadeldescriptor.eCDK_SubstructureFingerprintCount;
+import extendedlibpadeldescriptor.eCDK_KlekotaRothFingerprintCount;
+import extendedlibpadeldescriptor.eCDK_AtomPairs2DFingerprintCount;
+
+/**
+ * Calculator of the descriptors and fingerprints requested on the command line.
+ * Instances are not thread-safe: each thread must use its own.
+ */
+public class Calculator {
+    // Names of 1D and 2D descriptors, in order of calculation
+    private static final String[] DESCRIPTORS_2D = {"AcidicGroupCount", "ALOGP", "APol", "AromaticAtomsCount",
+            "AromaticBondsCount", "AtomCount", "Autocorrelation", "BaryszMatrix", "BasicGroupCount", "BCUT",
+            "BondCount", "BPol", "BurdenModifiedEigenvalues", "CarbonTypes", "ChiChain", "ChiCluster",
+            "ChiPathCluster", "ChiPath", "Constitutional", "Crippen", "DetourMatrix", "EccentricConnectivityIndex",
+            "ElectrotopologicalStateAtomType", "ExtendedTopochemicalAtom", "FMF", "FragmentComplexity",
+            "HBondAcceptorCount", "HBondDonorCount", "HybridizationRatio", "InformationContent", "KappaShapeIndices",
+            "LargestChain", "LargestPiSystem", "LongestAliphaticChain", "MannholdLogP", "McGowanVolume", "MDE",
+            "MLFER", "PathCount", "PetitjeanNumber", "RingCount", "RotatableBondsCount", "RuleOfFive", "Topological",
+            "TopologicalCharge", "TopologicalDistanceMatrix", "TPSA", "VABC", "VAdjMa", "WalkCount", "Weight",
+            "WeightedPath", "WienerNumbers", "XLogP", "ZagrebIndex"};
+    // Fingerprints made of counts rather than bits
+    private static final List<String> FINGERPRINT_COUNTS = Arrays.asList("SubFPC", "KRFPC", "AP2DFPC");
+    // Names of 3D descriptors, in order of calculation
+    private static final String[] DESCRIPTORS_3D = {"Autocorrelation3D", "CPSA", "GravitationalIndex",
+            "LengthOverBreadth", "MomentOfInertia", "PetitjeanShapeIndex", "RDF", "WHIM"};
+
+    private final CommandLine commandLine;
+    private List<CDK_Descriptor> descriptors;
+    private List<eCDK_IFingerprint> fps;
+    private final List<Boolean> fp_counts;
+    private final boolean binary;
+    // Cumulative calculation time of each descriptor and fingerprint, in nanoseconds
+    private final long[] desc_times;
+    private final long[] fp_times;
+    // Number of values of each descriptor and fingerprint calculator
+    private final int[] desc_sizes;
+    private final int[] fp_sizes;
+    // Time budgets of each calculator and of each molecule, in nanoseconds (0 if unlimited)
+    private final long timeout;
+    private final long molecule_timeout;
+    // Thread running calculations when time budgets are set
+    private ExecutorService executor;
+    // Whether a calculation was abandoned while still using calculators
+    private boolean stale = false;
+    // Whether calculations run on a separate thread and may be abandoned
+    private final boolean timed;
+
+    public Calculator(CommandLine commandLine) throws Exception {
+        this.commandLine = commandLine;
+        createCalculators();
+        fp_counts = new ArrayList<>();
+        if (commandLine.hasOption("fingerprint")) {
+            for (String fp_value : commandLine.getOptionValue("fingerprint").split(",")) {
+                fp_counts.add(FINGERPRINT_COUNTS.contains(fp_value.split(":")[0]));
+            }
+        }
+        binary = commandLine.hasOption("binary");
+        desc_times = new long[descriptors.size()];
+        fp_times = new long[fps.size()];
+        desc_sizes = new int[descriptors.size()];
+        for (int i = 0; i < descriptors.size(); i++) {
+            desc_sizes[i] = descriptors.get(i).getDescriptorNames().length;
+        }
+        fp_sizes = new int[fps.size()];
+        for (int i = 0; i < fps.size(); i++) {
+            // Use ethane as default molecule
+            fps.get(i).setMolecule(new SmilesParser(DefaultChemObjectBuilder.getInstance()).parseSmiles("CC"));
+            fp_sizes[i] = fps.get(i).getDescriptorNames().length;
+        }
+        timeout = commandLine.hasOption("timeout") ?
+                Long.parseLong(commandLine.getOptionValue("timeout")) * 1000000L : 0;
+        molecule_timeout = commandLine.hasOption("moleculeTimeout") ?
+                Long.parseLong(commandLine.getOptionValue("moleculeTimeout")) * 1000000L : 0;
+        timed = timeout > 0 || molecule_timeout > 0;
+    }
+
+    private void createCalculators() throws Exception {
+        // Instantiate descriptor calculators
+        descriptors = new ArrayList<>();
+        if (commandLine.hasOption("descriptors")) {
+            descriptors.addAll(getDescriptors(commandLine.hasOption("3D"), commandLine.getOptionValue("select")));
+        }
+        // Instantiate fingerprint calculators
+        fps = new ArrayList<>();
+        if (commandLine.hasOption("fingerprint")) {
+            int size;
+            // Get default size of fingerprints
+            if (commandLine.hasOption("nBits")) {
+                size = Integer.parseInt(commandLine.getOptionValue("nBits"));
+            }
+            else {
+                size = 1024;
+            }
+            // Same with search depth
+            int searchDepth;
+            if (commandLine.hasOption("searchDepth")) {
+                searchDepth = Integer.parseInt(commandLine.getOptionValue("searchDepth"));
+            }
+            else {
+                searchDepth = 7;
+            }
+            fps.addAll(getFingerprints(commandLine.getOptionValue("fingerprint"), size, searchDepth));
+        }
+    }
+
+    public String getNames() throws Exception {
+        // Names of each block (descriptors, then fingerprints) on a separate line
+        List<String> blocks = new ArrayList<>();
+        if (!descriptors.isEmpty()) {
+            List<String> names = new ArrayList<String>();
+            for (CDK_Descriptor desc : descriptors) {
+                names.addAll(Arrays.asList(desc.getDescriptorNames()));
+            }
+            blocks.add(String.join(" ", names));
+        }
+        for (eCDK_IFingerprint fp : fps) {
+            // Use ethane as default molecule
+            fp.setMolecule(new SmilesParser(DefaultChemObjectBuilder.getInstance()).parseSmiles("CC"));
+            blocks.add(String.join(" ", fp.getDescriptorNames()));
+        }
+        return String.join("\n", blocks);
+    }
+
+    public byte[] calculate(IAtomContainer molecule) throws Exception {
+        // Calculators of an abandoned calculation may still be in use
+        if (stale) {
+            createCalculators();
+            stale = false;
+        }
+        long deadline = System.nanoTime() + molecule_timeout;
+        List<String> values = new ArrayList<>();
+        List<String[]> fp_values = new ArrayList<>();
+        // Fingerprints work on the molecule as read, as when each was calculated by a separate ePaDEL run
+        IAtomContainer read = fps.isEmpty() || descriptors.isEmpty() || timed ? molecule : molecule.clone();
+        // Iterate over descriptors
+        for (int i = 0; i < descriptors.size(); i++) {
+            CDK_Descriptor desc = descriptors.get(i);
+            // Calculations that may be abandoned work on their own copy of the molecule
+            IAtomContainer current = timed ? molecule.clone() : molecule;
+            long start = System.nanoTime();
+            // Set molecule in descriptor calculator and run
+            values.addAll(Arrays.asList(run(() -> {
+                desc.setMolecule(current);
+                desc.run();
+                return desc.getDescriptorValues();
+            }, desc, desc_sizes[i], deadline)));
+            desc_times[i] += System.nanoTime() - start;
+        }
+        // Iterate over fingerprints
+        for (int i = 0; i < fps.size(); i++) {
+            eCDK_IFingerprint fp = fps.get(i);
+            // Fingerprint calculators may alter the molecule, and calculations may be abandoned
+            IAtomContainer current = read.clone();
+            long start = System.nanoTime();
+            // Set molecule in fingerprint calculator and run
+            fp_values.add(run(() -> {
+                fp.setMolecule(current);
+                fp.run();
+                return fp.getDescriptorValues();
+            }, fp, fp_sizes[i], deadline));
+            fp_times[i] += System.nanoTime() - start;
+        }
+        if (binary) {
+            return toBinary(values, fp_values);
+        }
+        for (String[] fp_value : fp_values) {
+            values.addAll(Arrays.asList(fp_value));
+        }
+        return (String.join(" ", values) + "\n").getBytes(StandardCharsets.UTF_8);
+    }
+
+    private String[] run(Callable<String[]> calculation, Object calculator, int size, long deadline) {
+        // Values of failed calculations
+        String[] empty = new String[size];
+        Arrays.fill(empty, "NaN");
+        String name = calculator.getClass().getSimpleName();
+        try {
+            if (!timed) {
+                return calculation.call();
+            }
+            // Time left for this calculation
+            long budget = timeout > 0 ? timeout : Long.MAX_VALUE;
+            if (molecule_timeout > 0) {
+                budget = Math.min(budget, deadline - System.nanoTime());
+            }
+            if (budget <= 0) {
+                System.err.println("WARNING\t" + name + " skipped: time budget of the molecule exhausted");
+                return empty;
+            }
+            if (executor == null) {
+                executor = Executors.newSingleThreadExecutor(runnable -> {
+                    // Abandoned calculations must not keep the JVM alive
+                    Thread thread = new Thread(runnable);
+                    thread.setDaemon(true);
+                    return thread;
+                });
+            }
+            Future<String[]> future = executor.submit(calculation);
+            try {
+                return future.get(budget, TimeUnit.NANOSECONDS);
+            } catch (TimeoutException e) {
+                // CDK calculators may ignore interruption: abandon the thread and its calculators
+                future.cancel(true);
+                executor.shutdownNow();
+                executor = null;
+                stale = true;
+                System.err.println("WARNING\t" + name + " timed out");
+                return empty;
+            } catch (ExecutionException e) {
+                // Errors (e.g. OutOfMemoryError) are not recovered from
+                if (e.getCause() instanceof Error) {
+                    throw (Error) e.getCause();
+                }
+                return failed(name, (Exception) e.getCause(), empty);
+            }
+        } catch (Exception e) {
+            return failed(name, e, empty);
+        }
+    }
+
+    private static String[] failed(String name, Exception e, String[] empty) {
+        // Values that cannot be calculated for this molecule are expected to be missing
+        if (!(e instanceof ArrayIndexOutOfBoundsException || e instanceof NullPointerException)) {
+            System.err.println("WARNING\t" + name + " failed: " + e);
+        }
+        return empty;
+    }
+
+    public void addTimings(Map<String, Long> timings) {
+        // Cumulative time of each class of descriptor and fingerprint calculators
+        for (int i = 0; i < descriptors.size(); i++) {
+            timings.merge(descriptors.get(i).getClass().getSimpleName(), desc_times[i], Long::sum);
+        }
+        for (int i = 0; i < fps.size(); i++) {
+            timings.merge(fps.get(i).getClass().getSimpleName(), fp_times[i], Long::sum);
+        }
+    }
+
+    private byte[] toBinary(List<String> desc_values, List<String[]> fp_values) {
+        // Determine the size of the row
+        int size = 8 * desc_values.size();
+        for (int i = 0; i < fp_values.size(); i++) {
+            size += 1 + fp_values.get(i).length * (fp_counts.get(i) ? 4 : 1);
+        }
+        ByteBuffer buffer = ByteBuffer.allocate(size).order(ByteOrder.LITTLE_ENDIAN);
+        // Descriptors as float64
+        for (String value : desc_values) {
+            double parsed;
+            try {
+                parsed = Double.parseDouble(value);
+            } catch (NumberFormatException | NullPointerException e) {
+                parsed = Double.NaN;
+            }
+            buffer.putDouble(parsed);
+        }
+        // Fingerprints as status followed by uint8 bits or int32 counts
+        for (int i = 0; i < fp_values.size(); i++) {
+            int start = buffer.position();
+            buffer.put((byte) 1);
+            boolean success = true;
+            for (String value : fp_values.get(i)) {
+                int parsed = 0;
+                try {
+                    // Counts are written as decimal numbers (e.g. 2.0)
+                    parsed = (int) Double.parseDouble(value);
+                } catch (NumberFormatException | NullPointerException e) {
+                    success = false;
+                }
+                if (fp_counts.get(i)) {
+                    buffer.putInt(parsed);
+                } else {
+                    buffer.put((byte) parsed);
+                }
+            }
+            if (!success) {
+                buffer.put(start, (byte) 0);
+            }
+        }
+        return buffer.array();
+    }
+
+    private static List<CDK_Descriptor> getDescriptors(boolean with3D, String selection) throws Exception {
+        // Names of descriptors, in order of calculation
+        List<String> names = new ArrayList<>(Arrays.asList(DESCRIPTORS_2D));
+        if (with3D) {
+            names.addAll(Arrays.asList(DESCRIPTORS_3D));
+        }
+        // Restrict to the selected descriptors
+        if (selection != null) {
+            List<String> selected = Arrays.asList(selection.split(","));
+            for (String name : selected) {
+                if (!Arrays.asList(DESCRIPTORS_2D).contains(name) && !Arrays.asList(DESCRIPTORS_3D).contains(name)) {
+                    // Not supported
+                    throw new Exception("Descriptor " + name + " is not available.");
+                }
+            }
+            names.retainAll(selected);
+        }
+        // Instantiate the descriptor calculators
+        List<CDK_Descriptor> descriptors = new ArrayList<>();
+        for (String name : names) {
+            descriptors.addAll(getDescriptor(name));
+        }
+        return descriptors;
+    }
+
+    private static List<CDK_Descriptor> getDescriptor(String name) throws Exception {
+        switch (name) {
+            case "AcidicGroupCount": return Arrays.asList(new CDK_AcidicGroupCountDescriptor());
+            case "ALOGP": return Arrays.asList(new CDK_ALOGPDescriptor());
+            case "APol": return Arrays.asList(new CDK_APolDescriptor());
+            case "AromaticAtomsCount": return Arrays.asList(new CDK_AromaticAtomsCountDescriptor());
+            case "AromaticBondsCount": return Arrays.asList(new CDK_AromaticBondsCountDescriptor());
+            case "AtomCount": return Arrays.asList(new CDK_AtomCountDescriptor(new String[] { "*" }),
+                    new CDK_HeavyAtomCountDescriptor(), new CDK_AtomCountDescriptor(new String[] { "H" }),
+                    new CDK_AtomCountDescriptor(new String[] { "B" }), new CDK_AtomCountDescriptor(new String[] { "C" }),
+                    new CDK_AtomCountDescriptor(new String[] { "N" }), new CDK_AtomCountDescriptor(new String[] { "O" }),
+                    new CDK_AtomCountDescriptor(new String[] { "S" }), new CDK_AtomCountDescriptor(new String[] { "P" }),
+                    new CDK_HalogenCountDescriptor());
+            case "Autocorrelation": return Arrays.asList(new CDK_AutocorrelationDescriptor());
+            case "BaryszMatrix": return Arrays.asList(new CDK_BaryszMatrixDescriptor());
+            case "BasicGroupCount": return Arrays.asList(new CDK_BasicGroupCountDescriptor());
+            case "BCUT": return Arrays.asList(new CDK_BCUTDescriptor());
+            case "BondCount": return Arrays.asList(new CDK_BondCountDescriptor());
+            case "BPol": return Arrays.asList(new CDK_BPolDescriptor());
+            case "BurdenModifiedEigenvalues": return Arrays.asList(new CDK_BurdenModifiedEigenvaluesDescriptor());
+            case "CarbonTypes": return Arrays.asList(new CDK_CarbonTypesDescriptor());
+            case "ChiChain": return Arrays.asList(new CDK_ChiChainDescriptor());
+            case "ChiCluster": return Arrays.asList(new CDK_ChiClusterDescriptor());
+            case "ChiPathCluster": return Arrays.asList(new CDK_ChiPathClusterDescriptor());
+            case "ChiPath": return Arrays.asList(new CDK_ChiPathDescriptor());
+            case "Constitutional": return Arrays.asList(new CDK_ConstitutionalDescriptor());
+            case "Crippen": return Arrays.asList(new CDK_CrippenDescriptor());
+            case "DetourMatrix": return Arrays.asList(new CDK_DetourMatrixDescriptor());
+            case "EccentricConnectivityIndex": return Arrays.asList(new CDK_EccentricConnectivityIndexDescriptor());
+            case "ElectrotopologicalStateAtomType": return Arrays.asList(new CDK_EStateAtomTypeDescriptor());
+            case "ExtendedTopochemicalAtom": return Arrays.asList(new CDK_ExtendedTopochemicalAtomDescriptor());
+            case "FMF": return Arrays.asList(new CDK_FMFDescriptor());
+            case "FragmentComplexity": return Arrays.asList(new CDK_FragmentComplexityDescriptor());
+            case "HBondAcceptorCount": return Arrays.asList(new CDK_HBondAcceptorCountDescriptor());
+            case "HBondDonorCount": return Arrays.asList(new CDK_HBondDonorCountDescriptor());
+            case "HybridizationRatio": return Arrays.asList(new CDK_HybridizationRatioDescriptor());
+            case "InformationContent": return Arrays.asList(new CDK_InformationContentDescriptor());
+            case "KappaShapeIndices": return Arrays.asList(new CDK_KappaShapeIndicesDescriptor());
+            case "LargestChain": return Arrays.asList(new CDK_LargestChainDescriptor());
+            case "LargestPiSystem": return Arrays.asList(new CDK_LargestPiSystemDescriptor());
+            case "LongestAliphaticChain": return Arrays.asList(new CDK_LongestAliphaticChainDescriptor());
+            case "MannholdLogP": return Arrays.asList(new CDK_MannholdLogPDescriptor());
+            case "McGowanVolume": return Arrays.asList(new CDK_McGowanVolumeDescriptor());
+            case "MDE": return Arrays.asList(new CDK_MDEDescriptor());
+            case "MLFER": return Arrays.asList(new CDK_MLFERDescriptor());
+            case "PathCount": return Arrays.asList(new CDK_PathCountDescriptor());
+            case "PetitjeanNumber": return Arrays.asList(new CDK_PetitjeanNumberDescriptor());
+            case "RingCount": return Arrays.asList(new CDK_RingCountDescriptor());
+            case "RotatableBondsCount": return Arrays.asList(new CDK_RotatableBondsCountDescriptor());
+            case "RuleOfFive": return Arrays.asList(new CDK_RuleOfFiveDescriptor());
+            case "Topological": return Arrays.asList(new CDK_TopologicalDescriptor());
+            case "TopologicalCharge": return Arrays.asList(new CDK_TopologicalChargeDescriptor());
+            case "TopologicalDistanceMatrix": return Arrays.asList(new CDK_TopologicalDistanceMatrixDescriptor());
+            case "TPSA": return Arrays.asList(new CDK_TPSADescriptor());
+            case "VABC": return Arrays.asList(new CDK_VABCDescriptor());
+            case "VAdjMa": return Arrays.asList(new CDK_VAdjMaDescriptor());
+            case "WalkCount": return Arrays.asList(new CDK_WalkCountDescriptor());
+            case "Weight": return Arrays.asList(new CDK_WeightDescriptor());
+            case "WeightedPath": return Arrays.asList(new CDK_WeightedPathDescriptor());
+            case "WienerNumbers": return Arrays.asList(new CDK_WienerNumbersDescriptor());
+            case "XLogP": return Arrays.asList(new CDK_XLogPDescriptor());
+            case "ZagrebIndex": return Arrays.asList(new CDK_ZagrebIndexDescriptor());
+            // 3D descriptors
+            case "Autocorrelation3D": return Arrays.asList(new CDK_Autocorrelation3DDescriptor());
+            case "CPSA": return Arrays.asList(new CDK_CPSADescriptor());
+            case "GravitationalIndex": return Arrays.asList(new CDK_GravitationalIndexDescriptor());
+            case "LengthOverBreadth": return Arrays.asList(new CDK_LengthOverBreadthDescriptor());
+            case "MomentOfInertia": return Arrays.asList(new CDK_MomentOfInertiaDescriptor());
+            case "PetitjeanShapeIndex": return Arrays.asList(new CDK_PetitjeanShapeIndexDescriptor());
+            case "RDF": return Arrays.asList(new CDK_RDFDescriptor());
+            case "WHIM": return Arrays.asList(new CDK_WHIMDescriptor());
+            default: throw new Exception("Descriptor " + name + " is not available.");
+        }
+    }
+
+    private static List<eCDK_IFingerprint> getFingerprints(String fp_values, int size, int searchDepth)
+            throws Exception {
+        // Fingerprints are separated by commas and may define their own size and search depth
+        // (e.g. FP:2048:8,PubchemFP)
+        List<eCDK_IFingerprint> fps = new ArrayList<>();
+        for (String fp_value : fp_values.split(",")) {
+            String[] fields = fp_value.split(":");
+            int fp_size = fields.length > 1 ? Integer.parseInt(fields[1]) : size;
+            int fp_searchDepth = fields.length > 2 ? Integer.parseInt(fields[2]) : searchDepth;
+            fps.add(getFingerprint(fields[0], fp_size, fp_searchDepth));
+        }
+        return fps;
+    }
+
+    private static eCDK_IFingerprint getFingerprint(String fp_value, int size, int searchDepth) throws Exception {
+        // Fingerprint names, to be chosen from
+        // Cannot instantiate as size and search depth may vary
+        List<String> fingerprints = new ArrayList<>(Arrays.asList("FP", "ExtFP", "EStateFP", "GraphFP", "MACCSFP",
+                "PubchemFP", "SubFP", "KRFP", "AP2DFP", "SubFPC", "KRFPC", "AP2DFPC"));
+        if (!fingerprints.contains(fp_value)){
+            // Not supported
+            throw new Exception("Fingerprint type " + fp_value + " is not available.");
+        }
+        // Instantiate fingerprint calculator
+        eCDK_IFingerprint fp;
+        if (fp_value.equals("FP")) {
+            fp = new eCDK_Fingerprinter(size, searchDepth);
+        } else if (fp_value.equals("ExtFP")) {
+            // Size and searchDepth not supported with CDK < 2.5
+            fp = new eCDK_ExtendedFingerprinter(); //size, searchDepth);
+        } else if (fp_value.equals("EStateFP")) {
+            fp = new eCDK_EStateFingerprinter();
+        } else if (fp_value.equals("GraphFP")) {
+            fp = new eCDK_GraphOnlyFingerprinter(size, searchDepth);
+        } else if (fp_value.equals("MACCSFP")) {
+            fp = new eCDK_MACCSFingerprinter();
+        } else if (fp_value.equals("PubchemFP")) {
+            fp = new eCDK_PubchemFingerprinter();
+        } else if (fp_value.equals("SubFP")) {
+            fp = new eCDK_SubstructureFingerprinter();
+        } else if (fp_value.equals("KRFP")) {
+            fp = new eCDK_KlekotaRothFingerprinter();
+        } else if (fp_value.equals("AP2DFP")) {
+            fp = new eCDK_AtomPairs2DFingerprinter();
+        } else if (fp_value.equals("SubFPC")) {
+            fp = new eCDK_SubstructureFingerprintCount();
+        } else if (fp_value.equals("KRFPC")) {
+            fp = new eCDK_KlekotaRothFingerprintCount();
+        } else if (fp_value.equals("AP2DFPC")) {
+            fp = new eCDK_AtomPairs2DFingerprintCount();
+        } else {
+            // Default to eCDKFingerprinter
+            fp = new eCDK_Fingerprinter(size, searchDepth);
+        }
+        return fp;
+    }
+}
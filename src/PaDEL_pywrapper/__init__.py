@@ -3,6 +3,10 @@
 """Wrapper for PaDEL descriptors"""
 
 from .padel_wrapper import PaDEL
+from .cache import DescriptorCache
+from .conformers import ConformerGenerator
+from .scheduling import SchedulingStats
+from .instrumentation import CalculationStats
 from .descriptor import descriptors
 
 __version__ = "1.0.6"
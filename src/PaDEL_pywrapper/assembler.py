@@ -0,0 +1,83 @@
+# -*- coding: utf-8
+
+"""Assembly of descriptor values into preallocated tables."""
+
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ResultAssembler:
+    """Table of values preallocated for all molecules, including skipped ones, and filled one block at a time.
+
+    Each block keeps its own data type. Rows of skipped molecules (or of fingerprints that could not be calculated)
+    are NaN in floating point blocks and masked in integer blocks (pandas nullable arrays).
+    """
+
+    def __init__(self, n_rows: int, skipped: List[int]) -> None:
+        """Instantiate an empty table.
+
+        :param n_rows: total number of molecules
+        :param skipped: positions of molecules that were skipped
+        """
+        self.n_rows = n_rows
+        # Positions of calculated molecules
+        self.kept = np.setdiff1d(np.arange(n_rows), skipped)
+        self._frames = []
+
+    def add(self, names: List[str], values: np.ndarray, dtype: Optional[np.dtype] = None,
+            failed: Optional[np.ndarray] = None) -> None:
+        """Write the values of a block of columns into place.
+
+        :param names: names of the columns of the block
+        :param values: values of the calculated molecules
+        :param dtype: data type of the block (default: that of values)
+        :param failed: for each calculated molecule, whether values of the block could not be calculated
+        """
+        dtype = np.dtype(dtype if dtype is not None else values.dtype)
+        missing = np.ones(self.n_rows, dtype=bool)
+        missing[self.kept] = False
+        if failed is not None:
+            missing[self.kept[failed]] = True
+        # NaN cannot be held by integers
+        if values.dtype.kind == 'f' and dtype.kind != 'f':
+            nans = np.isnan(values).any(axis=1)
+            missing[self.kept[nans]] = True
+            values = np.nan_to_num(values, nan=0)
+        # Columns are contiguous, as in pandas blocks
+        block = np.empty((self.n_rows, len(names)), dtype=dtype, order='F')
+        block[self.kept] = values
+        if not missing.any():
+            self._frames.append(pd.DataFrame(block, columns=names, copy=False))
+        elif dtype.kind == 'f':
+            block[missing] = np.nan
+            self._frames.append(pd.DataFrame(block, columns=names, copy=False))
+        else:
+            block[missing] = 0
+            self._frames.append(pd.DataFrame({name: pd.arrays.IntegerArray(block[:, i], missing.copy())
+                                              for i, name in enumerate(names)}))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Obtain the assembled table."""
+        if not len(self._frames):
+            return pd.DataFrame(index=pd.RangeIndex(self.n_rows))
+        if len(self._frames) == 1:
+            return self._frames[0]
+        return pd.concat(self._frames, axis=1)
+
+
+def take_rows(frame: pd.DataFrame, start: int, stop: int) -> pd.DataFrame:
+    """Obtain a range of rows of an assembled table, with the data types they would have been assembled with alone.
+
+    Integer columns are nullable only if some of the rows are missing.
+
+    :param frame: assembled table
+    :param start: position of the first row
+    :param stop: position after the last row
+    """
+    rows = frame.iloc[start:stop].reset_index(drop=True)
+    dtypes = {name: column.dtype.numpy_dtype for name, column in rows.items()
+              if pd.api.types.is_extension_array_dtype(column.dtype) and pd.api.types.is_integer_dtype(column.dtype)
+              and not column.isna().any()}
+    return rows.astype(dtypes) if len(dtypes) else rows
@@ -0,0 +1,320 @@
+# -*- coding: utf-8
+
+"""Resumable, sharded calculation of descriptors of large files of molecules.
+
+Example:
+    padel-batch library.smi output_dir --descriptors all --fingerprints PubchemFP --shard-size 100000 --njobs 8
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from rdkit import RDLogger
+
+from .descriptor import _fingerprints, descriptors as _descriptors
+from .padel_wrapper import PaDEL
+from .utils import index_records
+
+# Formats of shards, also used as their extension
+SHARD_FORMATS = ['parquet', 'feather', 'npy']
+
+
+class ShardedRun:
+    """Calculation of descriptors of a file of molecules split into shards of consecutive molecules.
+
+    Each shard is written atomically to the output directory, alongside a record of its completion.
+    Processes of one or more machines sharing the output directory claim shards with lock files,
+    so that the run can be scaled out and resumed by running it again: completed shards are skipped.
+    A shard whose lock was abandoned (i.e. not refreshed for lock_timeout seconds, or whose process is dead)
+    is processed again.
+    """
+
+    def __init__(self, path: str, output_dir: str, shard_size: int = 10000, format: str = 'parquet',
+                 lock_timeout: float = 600) -> None:
+        """Instantiate a sharded run.
+
+        :param path: path to the SD or SMILES file of molecules
+        :param output_dir: directory holding shards, their completion records and the manifest of the run
+        :param shard_size: number of molecules of each shard
+        :param format: format of shards; one of {'parquet', 'feather', 'npy'} (see PaDEL.calculate_to_file)
+        :param lock_timeout: time in seconds after which the lock of a shard not being refreshed is abandoned
+        """
+        if format not in SHARD_FORMATS:
+            raise ValueError(f'format {format} is not supported.')
+        if shard_size < 1:
+            raise ValueError('shard_size must be at least 1.')
+        self.path = os.path.abspath(path)
+        self.output_dir = os.path.abspath(output_dir)
+        self.shard_size = shard_size
+        self.format = format
+        self.lock_timeout = lock_timeout
+        self._index = None
+
+    @property
+    def index(self) -> np.ndarray:
+        """Byte ranges of the records of the input file, indexed once and shared by all processes."""
+        if self._index is None:
+            path = os.path.join(self.output_dir, 'index.npy')
+            if os.path.isfile(path):
+                self._index = np.load(path)
+            else:
+                self._index = index_records(self.path)
+                os.makedirs(self.output_dir, exist_ok=True)
+                self._write_atomically(path, lambda handle: np.save(handle, self._index), binary=True)
+        return self._index
+
+    @property
+    def n_shards(self) -> int:
+        """Number of shards of the run."""
+        return -(-len(self.index) // self.shard_size)
+
+    def shard_path(self, shard: int) -> str:
+        """Path to the values of a shard."""
+        return os.path.join(self.output_dir, f'shard-{shard:06d}.{self.format}')
+
+    def record_path(self, shard: int) -> str:
+        """Path to the record of the completion of a shard."""
+        return os.path.join(self.output_dir, f'shard-{shard:06d}.json')
+
+    def completed(self) -> List[int]:
+        """Shards whose values were written."""
+        files = set(os.listdir(self.output_dir)) if os.path.isdir(self.output_dir) else set()
+        return [shard for shard in range(self.n_shards) if f'shard-{shard:06d}.json' in files]
+
+    def run(self, padel: PaDEL, njobs: int = 1, chunksize: int = 100, java_threads: int = 1) -> Dict[str, int]:
+        """Calculate the values of all shards not yet completed nor claimed by another process.
+
+        :param padel: descriptors to be calculated
+        :param njobs: number of concurrent processes calculating a shard
+        :param chunksize: number of molecules of each chunk calculated by a process
+        :param java_threads: number of threads of each ePaDEL process
+        :return: the number of shards, of shards completed and of shards calculated by this call
+        """
+        os.makedirs(os.path.join(self.output_dir, 'locks'), exist_ok=True)
+        self._check_manifest(padel)
+        completed = set(self.completed())
+        calculated = 0
+        for shard in range(self.n_shards):
+            if shard in completed or not self._claim(shard):
+                continue
+            try:
+                # Completed by another process in the meantime
+                if os.path.isfile(self.record_path(shard)):
+                    continue
+                self._calculate(shard, padel, njobs, chunksize, java_threads)
+                calculated += 1
+            finally:
+                self._release(shard)
+        return {'shards': self.n_shards, 'completed': len(self.completed()), 'calculated': calculated}
+
+    def _calculate(self, shard: int, padel: PaDEL, njobs: int, chunksize: int, java_threads: int) -> None:
+        """Calculate the values of a shard and write them atomically, keeping its lock alive meanwhile."""
+        start_time = time.time()
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_alive, args=(shard, stop), daemon=True)
+        heartbeat.start()
+        calculated = []
+
+        def count(chunks):
+            # Molecules with at least one value
+            for chunk in chunks:
+                calculated.append(int(chunk.notna().any(axis=1).sum()))
+                yield chunk
+
+        try:
+            ranges = self.index[shard * self.shard_size:(shard + 1) * self.shard_size]
+            # Processes read and parse the molecules of their byte range themselves
+            chunks = [('file', (self.path, int(ranges[i, 0]), int(ranges[min(i + chunksize, len(ranges)) - 1, 1])))
+                      for i in range(0, len(ranges), chunksize)]
+            path = self.shard_path(shard)
+            tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp.{self.format}'
+            padel._write_values(count(padel._iter_sources(chunks, njobs, java_threads)), tmp_path, self.format,
+                                len(ranges))
+            os.replace(tmp_path, path)
+        finally:
+            stop.set()
+            heartbeat.join()
+        record = {'shard': shard, 'start': shard * self.shard_size, 'end': shard * self.shard_size + len(ranges),
+                  'calculated': sum(calculated),
+                  'host': socket.gethostname(), 'pid': os.getpid(), 'seconds': time.time() - start_time}
+        self._write_atomically(self.record_path(shard), lambda handle: json.dump(record, handle))
+
+    def _check_manifest(self, padel: PaDEL) -> None:
+        """Create the manifest of the run, or ensure the output directory holds the same run."""
+        stat = os.stat(self.path)
+        manifest = {'input': self.path, 'input_size': stat.st_size, 'input_mtime': stat.st_mtime,
+                    'molecules': len(self.index), 'shard_size': self.shard_size, 'shards': self.n_shards,
+                    'format': self.format, 'configuration': padel._configuration_key(),
+                    'columns': [name for names, _ in padel._get_blocks(padel._run_names(padel._create_command()[0]))
+                                for name in names]}
+        path = os.path.join(self.output_dir, 'manifest.json')
+        if not os.path.isfile(path):
+            self._write_atomically(path, lambda handle: json.dump(manifest, handle, indent=2))
+        with open(path) as handle:
+            existing = json.load(handle)
+        for key, value in manifest.items():
+            if key != 'input' and existing.get(key) != value:
+                raise ValueError(f'{self.output_dir} holds a different run ({key} differs).')
+
+    def _lock_path(self, shard: int) -> str:
+        """Path to the lock file of a shard."""
+        return os.path.join(self.output_dir, 'locks', f'shard-{shard:06d}.lock')
+
+    def _claim(self, shard: int) -> bool:
+        """Try to claim a shard, taking over abandoned locks."""
+        path = self._lock_path(shard)
+        owner = json.dumps({'host': socket.gethostname(), 'pid': os.getpid()})
+        for _ in range(2):
+            try:
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._abandoned(path):
+                    return False
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(descriptor, 'w') as handle:
+                handle.write(owner)
+            return True
+        return False
+
+    def _abandoned(self, path: str) -> bool:
+        """Whether a lock is no longer refreshed or belongs to a dead process of this machine."""
+        try:
+            if time.time() - os.path.getmtime(path) > self.lock_timeout:
+                return True
+            with open(path) as handle:
+                owner = json.load(handle)
+        except (OSError, ValueError):
+            # Being written or removed
+            return False
+        # Processes cannot be probed on Windows without being terminated
+        if owner.get('host') != socket.gethostname() or sys.platform == 'win32':
+            return False
+        try:
+            os.kill(owner['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except (OSError, KeyError, TypeError):
+            return False
+        return False
+
+    def _keep_alive(self, shard: int, stop: threading.Event) -> None:
+        """Refresh the lock of a shard until stopped."""
+        while not stop.wait(self.lock_timeout / 4):
+            try:
+                os.utime(self._lock_path(shard))
+            except OSError:
+                pass
+
+    def _release(self, shard: int) -> None:
+        """Remove the lock of a shard."""
+        try:
+            os.remove(self._lock_path(shard))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _write_atomically(path: str, write, binary: bool = False) -> None:
+        """Write a file atomically as other processes may be reading it.
+
+        :param path: path to the file
+        :param write: function writing the content of the file to an open handle
+        :param binary: whether the content is binary
+        """
+        tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb' if binary else 'w') as handle:
+            write(handle)
+        os.replace(tmp_path, path)
+
+    def load(self) -> pd.DataFrame:
+        """Obtain the values of all completed shards, indexed by the position of molecules in the input file."""
+        with open(os.path.join(self.output_dir, 'manifest.json')) as handle:
+            columns = json.load(handle)['columns']
+        frames = []
+        for shard in self.completed():
+            with open(self.record_path(shard)) as handle:
+                record = json.load(handle)
+            path = self.shard_path(shard)
+            if self.format == 'parquet':
+                frame = pd.read_parquet(path)
+            elif self.format == 'feather':
+                frame = pd.read_feather(path)
+            else:
+                frame = pd.DataFrame(np.load(path), columns=columns)
+            frame.index = pd.RangeIndex(record['start'], record['end'])
+            frames.append(frame)
+        if not len(frames):
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames)
+
+
+def get_descriptors(names: List[str], fingerprints: List[str], with_3D: bool = False) -> list:
+    """Obtain descriptors and fingerprints from their names.
+
+    :param names: names of descriptors, or 'all'
+    :param fingerprints: short names of fingerprints (e.g. PubchemFP)
+    :param with_3D: include 3D descriptors when all are requested
+    """
+    selected = []
+    for name in names:
+        if name == 'all':
+            selected.extend(desc for desc in _descriptors if with_3D or not desc.is_3D)
+            continue
+        matches = [desc for desc in _descriptors if desc.name == name]
+        if not len(matches):
+            raise ValueError(f'descriptor {name} is not a valid PaDEL descriptor.')
+        selected.extend(matches)
+    for name in fingerprints:
+        matches = [fp for fp in _fingerprints if fp.short_name == name]
+        if not len(matches):
+            raise ValueError(f'fingerprint {name} is not a valid PaDEL fingerprint.')
+        selected.extend(matches)
+    return selected
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run a sharded calculation from the command line."""
+    parser = argparse.ArgumentParser(description='Calculate PaDEL descriptors of a large SD or SMILES file in '
+                                                 'resumable shards. Run it again (possibly on several machines '
+                                                 'sharing the output directory) to resume or scale out.')
+    parser.add_argument('input', help='SD file (.sd, .sdf, .mol) or SMILES file (one molecule per line)')
+    parser.add_argument('output_dir', help='directory of shards and manifest of the run')
+    parser.add_argument('--descriptors', nargs='*', default=None,
+                        help="names of descriptors or 'all' (default: all unless fingerprints are given)")
+    parser.add_argument('--fingerprints', nargs='*', default=[], help='short names of fingerprints (e.g. PubchemFP)')
+    parser.add_argument('--3D', dest='with_3D', action='store_true',
+                        help='calculate 3D descriptors (molecules must have 3D coordinates)')
+    parser.add_argument('--add-hs', action='store_true', help='add missing hydrogen atoms to molecules')
+    parser.add_argument('--shard-size', type=int, default=10000, help='number of molecules of each shard')
+    parser.add_argument('--format', choices=list(SHARD_FORMATS), default='parquet', help='format of shards')
+    parser.add_argument('--njobs', type=int, default=1, help='number of concurrent processes')
+    parser.add_argument('--chunksize', type=int, default=100, help='number of molecules of each chunk')
+    parser.add_argument('--java-threads', type=int, default=1, help='number of threads of each ePaDEL process')
+    parser.add_argument('--lock-timeout', type=float, default=600,
+                        help='seconds after which the lock of a shard not being refreshed is abandoned')
+    args = parser.parse_args(argv)
+    if args.descriptors is None:
+        args.descriptors = [] if len(args.fingerprints) else ['all']
+    # Molecules that cannot be parsed are expected in large libraries
+    RDLogger.DisableLog('rdApp.*')
+    padel = PaDEL(get_descriptors(args.descriptors, args.fingerprints, args.with_3D), ignore_3D=not args.with_3D,
+                  add_hs=args.add_hs)
+    padel.warm_up()
+    run = ShardedRun(args.input, args.output_dir, args.shard_size, args.format, args.lock_timeout)
+    summary = run.run(padel, njobs=args.njobs, chunksize=args.chunksize, java_threads=args.java_threads)
+    print(f'{summary["calculated"]} shard(s) calculated, {summary["completed"]} of {summary["shards"]} completed.')
+
+
+if __name__ == '__main__':
+    main()
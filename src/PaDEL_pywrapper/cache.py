@@ -0,0 +1,153 @@
+# -*- coding: utf-8
+
+"""Persistent on-disk cache of calculated descriptors."""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class DescriptorCache:
+    """SQLite-backed cache of descriptor values with size-bounded LRU eviction.
+
+    Values are stored per molecule and per descriptor configuration
+    (i.e. set of descriptors and fingerprints, their parameters, ePaDEL, the jars it depends on and the Java runtime).
+    """
+
+    def __init__(self, path: str, max_size: Optional[int] = None) -> None:
+        """Open or create a descriptor cache.
+
+        :param path: path to the SQLite database file
+        :param max_size: maximum size in bytes of the cached values; least recently used values
+         are evicted beyond this size (default: unbounded)
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection to the underlying database, opened on first use."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            with self._connection:
+                self._connection.execute('CREATE TABLE IF NOT EXISTS configs '
+                                         '(config TEXT PRIMARY KEY, columns TEXT NOT NULL)')
+                self._connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                         '(config TEXT NOT NULL, molecule TEXT NOT NULL, value BLOB NOT NULL, '
+                                         'size INTEGER NOT NULL, accessed REAL NOT NULL, '
+                                         'PRIMARY KEY (config, molecule))')
+                self._connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+                # Running total of the size of values, kept up to date by triggers
+                self._connection.execute('CREATE TABLE IF NOT EXISTS totals '
+                                         '(name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+                self._connection.execute("INSERT OR IGNORE INTO totals VALUES ('size', "
+                                         "(SELECT COALESCE(SUM(size), 0) FROM entries))")
+                self._connection.execute('CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN '
+                                         "UPDATE totals SET value = value + NEW.size WHERE name = 'size'; END")
+                self._connection.execute('CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN '
+                                         "UPDATE totals SET value = value - OLD.size WHERE name = 'size'; END")
+            # Rows replaced by INSERT OR REPLACE fire delete triggers
+            self._connection.execute('PRAGMA recursive_triggers = ON')
+        return self._connection
+
+    def __getstate__(self) -> dict:
+        """Do not pickle the connection to the database."""
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hits, misses and evictions since the cache was opened."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def get_columns(self, config: str) -> Optional[List[str]]:
+        """Obtain the names of the values cached for a descriptor configuration.
+
+        :param config: key of the descriptor configuration
+        """
+        row = self.connection.execute('SELECT columns FROM configs WHERE config = ?', (config,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get(self, config: str, molecules: List[str]) -> Dict[str, np.ndarray]:
+        """Obtain the cached values of molecules.
+
+        :param config: key of the descriptor configuration
+        :param molecules: keys of the molecules
+        :return: the values of molecules found in the cache, indexed by their key
+        """
+        found = {}
+        unique = list(dict.fromkeys(molecules))
+        # Stay below the maximum number of SQLite variables
+        for i in range(0, len(unique), 500):
+            keys = unique[i:i + 500]
+            rows = self.connection.execute('SELECT molecule, value FROM entries WHERE config = ? AND molecule IN '
+                                           f'({",".join("?" * len(keys))})', [config] + keys).fetchall()
+            found.update((molecule, np.frombuffer(value, dtype='<f8')) for molecule, value in rows)
+        # Mark as recently used
+        if len(found):
+            with self.connection:
+                self.connection.executemany('UPDATE entries SET accessed = ? WHERE config = ? AND molecule = ?',
+                                            [(time.time(), config, molecule) for molecule in found])
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put(self, config: str, columns: List[str], values: Dict[str, np.ndarray]) -> None:
+        """Add values of molecules to the cache.
+
+        :param config: key of the descriptor configuration
+        :param columns: names of the values
+        :param values: values of molecules, indexed by their key
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO configs VALUES (?, ?)', (config, json.dumps(columns)))
+            self.connection.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                        [(config, molecule, value.astype('<f8').tobytes(), value.size * 8, now)
+                                         for molecule, value in values.items()])
+        if self.max_size is not None:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used values until the cache fits its maximum size."""
+        with self.connection:
+            excess = self.size - self.max_size
+            if excess <= 0:
+                return
+            # Only read as many of the least recently used entries as need to be removed
+            evicted = []
+            cursor = self.connection.execute('SELECT rowid, size FROM entries ORDER BY accessed')
+            for rowid, size in cursor:
+                if excess <= 0:
+                    break
+                evicted.append((rowid,))
+                excess -= size
+            cursor.close()
+            self.connection.executemany('DELETE FROM entries WHERE rowid = ?', evicted)
+        self.evictions += len(evicted)
+
+    @property
+    def size(self) -> int:
+        """Size in bytes of the cached values."""
+        return self.connection.execute("SELECT value FROM totals WHERE name = 'size'").fetchone()[0]
+
+    def clear(self) -> None:
+        """Remove all cached values."""
+        with self.connection:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.execute('DELETE FROM configs')
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
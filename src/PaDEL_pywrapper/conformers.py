@@ -0,0 +1,102 @@
+# -*- coding: utf-8
+
+"""Generation of 3D conformers of molecules lacking them."""
+
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+# Geometries already embedded by the current process, indexed by generator and structure
+_geometries: 'OrderedDict[tuple, Chem.Mol]' = OrderedDict()
+
+
+class ConformerGenerator:
+    """Generator of 3D conformers with ETKDG, optimized with a force field.
+
+    Molecules are embedded in canonical atom order from a fixed seed, so that the geometry of a structure
+    does not depend on the order of its atoms nor on the process embedding it.
+    Geometries are cached by structure in each process.
+    """
+
+    def __init__(self, n_conformers: int = 1, force_field: Optional[str] = 'MMFF', max_iterations: int = 500,
+                 seed: int = 42, max_cached: int = 10000) -> None:
+        """Instantiate a generator of 3D conformers.
+
+        :param n_conformers: number of conformers to be embedded, the one of lowest energy being kept
+        :param force_field: force field optimizing conformers; one of {'MMFF', 'UFF', None}.
+         UFF is used for molecules MMFF cannot parametrize; conformers are not optimized if None.
+        :param max_iterations: maximum number of iterations of the optimization
+        :param seed: seed of the random number generator of ETKDG
+        :param max_cached: maximum number of geometries cached by each process
+        """
+        if n_conformers < 1:
+            raise ValueError('n_conformers must be at least 1.')
+        if force_field not in ['MMFF', 'UFF', None]:
+            raise ValueError(f'force field {force_field} is not supported.')
+        self.n_conformers = n_conformers
+        self.force_field = force_field
+        self.max_iterations = max_iterations
+        self.seed = seed
+        self.max_cached = max_cached
+
+    @property
+    def key(self) -> str:
+        """Parameters determining the geometries of molecules."""
+        return f'ETKDGv3:{self.n_conformers}:{self.force_field}:{self.max_iterations}:{self.seed}'
+
+    def embed(self, mol: Chem.Mol) -> Optional[Chem.Mol]:
+        """Obtain a molecule with hydrogen atoms and a single 3D conformer.
+
+        :param mol: RDKit molecule
+        :return: the embedded molecule, or None if it could not be embedded
+        """
+        cache_key = (self.key, Chem.MolToSmiles(mol))
+        if cache_key in _geometries:
+            _geometries.move_to_end(cache_key)
+            embedded = _geometries[cache_key]
+        else:
+            embedded = self._embed(mol)
+            _geometries[cache_key] = embedded
+            while len(_geometries) > self.max_cached:
+                _geometries.popitem(last=False)
+        if embedded is None:
+            return None
+        embedded = Chem.Mol(embedded)
+        if mol.HasProp('_Name'):
+            embedded.SetProp('_Name', mol.GetProp('_Name'))
+        return embedded
+
+    def _embed(self, mol: Chem.Mol) -> Optional[Chem.Mol]:
+        """Embed conformers of a molecule and keep the one of lowest energy."""
+        # Canonical atom order
+        order = np.argsort(list(Chem.CanonicalRankAtoms(mol, breakTies=True))).tolist()
+        embedded = Chem.AddHs(Chem.RenumberAtoms(Chem.Mol(mol), order))
+        embedded.RemoveAllConformers()
+        params = AllChem.ETKDGv3()
+        params.randomSeed = self.seed
+        conformers = list(AllChem.EmbedMultipleConfs(embedded, self.n_conformers, params))
+        # Start from random coordinates should ETKDG fail (e.g. large rings, unusual geometries)
+        if not len(conformers):
+            params.useRandomCoords = True
+            conformers = list(AllChem.EmbedMultipleConfs(embedded, self.n_conformers, params))
+            if not len(conformers):
+                return None
+        energies = self._optimize(embedded)
+        return Chem.Mol(embedded, confId=conformers[int(np.argmin(energies))])
+
+    def _optimize(self, mol: Chem.Mol) -> List[float]:
+        """Optimize conformers of a molecule in place.
+
+        :return: the energy of each conformer (zeros if not optimized)
+        """
+        results = []
+        if self.force_field == 'MMFF' and AllChem.MMFFHasAllMoleculeParams(mol):
+            results = AllChem.MMFFOptimizeMoleculeConfs(mol, maxIters=self.max_iterations)
+        elif self.force_field is not None and AllChem.UFFHasAllMoleculeParams(mol):
+            results = AllChem.UFFOptimizeMoleculeConfs(mol, maxIters=self.max_iterations)
+        if not len(results):
+            return [0.0] * mol.GetNumConformers()
+        return [energy for _, energy in results]
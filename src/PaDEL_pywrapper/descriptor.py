@@ -3,59 +3,109 @@
 
 """Python wrapper for PaDEL descriptors"""
 
+import functools
 import os
+from typing import Dict
 
 import numpy as np
 import pandas as pd
 
 
+@functools.lru_cache(maxsize=None)
+def _load_metadata(path: str, key: str) -> Dict[str, pd.DataFrame]:
+    """Load the metadata of descriptors or fingerprints once per process.
+
+    :param path: name of the metadata file shipped with the package
+    :param key: column holding the name of descriptors or fingerprints
+    :return: the rows of the metadata file, grouped by descriptor or fingerprint
+    """
+    path = os.path.abspath(os.path.join(os.path.dirname(__file__), path))
+    table = pd.read_csv(path, sep='\t')
+    metadata = {name: rows for name, rows in table.groupby(key, sort=False)}
+    # Rows of unknown descriptors
+    metadata[None] = table.iloc[:0]
+    return metadata
+
+
 class Descriptor:
-    """Primitive PaDEL descriptor."""
+    """Primitive PaDEL descriptor.
+
+    Metadata is only loaded when first accessed and is shared by all descriptors.
+    """
 
     def __init__(self, name: str, is_3D: bool):
         """Instantiate a descriptor.
 
         :param name: Name of the descriptor
         :param is_3D: Is the descriptor requiring 3D molecular coordinates
-        :param type: Type of descriptor
-        :param description: Description of the descriptor
         """
         self.name = name
         self.is_3D = is_3D
-        # Get names of bits (e.g. for AtomPairs2DFP: AP2DFP)
-        self._get_sub_descriptor_names('padel_descs.tsv')
 
-    def _get_sub_descriptor_names(self, path: str):
-        """Load names of the subcomponents making this descriptor."""
-        path = os.path.abspath(os.path.join(os.path.dirname(__file__), path))
-        descs = pd.read_csv(path, sep='\t')
-        self.subcomponents = descs[descs.descriptor == self.name].name.tolist()
-        self.description = descs[descs.descriptor == self.name][['name', 'description']]
+    @property
+    def _metadata(self) -> pd.DataFrame:
+        """Rows of the metadata file describing this descriptor."""
+        metadata = _load_metadata('padel_descs.tsv', 'descriptor')
+        return metadata.get(self.name, metadata[None])
+
+    @property
+    def subcomponents(self):
+        """Names of the subcomponents making this descriptor."""
+        return self._metadata.name.tolist()
+
+    @property
+    def description(self):
+        """Description of the subcomponents making this descriptor."""
+        return self._metadata[['name', 'description']]
 
 
 class Fingerprint:
-    """Primitive PaDEL fingerprint."""
+    """Primitive PaDEL fingerprint.
+
+    Metadata is only loaded when first accessed and is shared by all fingerprints.
+    """
 
     def __init__(self, name: str):
         """Instantiate a fingerprint.
 
         :param name: Name of the fingerprint
-        :param type: Name ePaDEL uses to compute the fingerprint
         """
         self.name = name
         self.is_3D = False
-        # Get names of bits (e.g. for Atom: CrippenLogP & CrippenMR)
-        self._get_sub_descriptor_names('padel_fps.tsv')
-
-    def _get_sub_descriptor_names(self, path: str):
-        """Load names of the subcomponents making this descriptor."""
-        path = os.path.abspath(os.path.join(os.path.dirname(__file__), path))
-        fps = pd.read_csv(path, sep='\t')
-        self.bit_prefix = fps[fps.fingerprint == self.name].name.values[0]
-        nbits = fps[fps.fingerprint == self.name]['fixed size'].values[0]
-        self.nBits = nbits if nbits != '-' else np.nan
-        self.short_name = fps[fps.fingerprint == self.name]['name'].item()
-        self.description = fps[fps.fingerprint == self.name]['description']
+        self.is_count = name.endswith('count')
+
+    @property
+    def _metadata(self) -> pd.DataFrame:
+        """Rows of the metadata file describing this fingerprint."""
+        metadata = _load_metadata('padel_fps.tsv', 'fingerprint')
+        return metadata.get(self.name, metadata[None])
+
+    @property
+    def bit_prefix(self):
+        """Name ePaDEL uses to compute the fingerprint."""
+        return self._metadata.name.values[0]
+
+    @property
+    def short_name(self):
+        """Short name of the fingerprint."""
+        return self._metadata['name'].item()
+
+    @property
+    def description(self):
+        """Description of the fingerprint."""
+        return self._metadata['description']
+
+    @property
+    def nBits(self):
+        """Number of bits of the fingerprint."""
+        if hasattr(self, '_nBits'):
+            return self._nBits
+        nbits = self._metadata['fixed size'].values[0]
+        return nbits if nbits != '-' else np.nan
+
+    @nBits.setter
+    def nBits(self, value):
+        self._nBits = value
 
     def __call__(self, size: int = 1024, searchDepth: int = 7):
         """Define size and search depth for CDK and Graph only fingerprints.
@@ -0,0 +1,129 @@
+# -*- coding: utf-8
+
+"""Coalescing of concurrent asynchronous calculations."""
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Tuple
+
+import pandas as pd
+from rdkit import Chem
+
+from .assembler import take_rows
+
+
+class AsyncDispatcher:
+    """Dispatcher of the calculations requested within an event loop, with a bounded number of concurrent JVMs.
+
+    Requests waiting for a JVM to be available are coalesced into a single ePaDEL run.
+    """
+
+    def __init__(self, calculate: Callable[[List[Chem.Mol]], Awaitable[pd.DataFrame]], max_jvms: int,
+                 max_batch_size: int) -> None:
+        """Instantiate a dispatcher for the running event loop.
+
+        :param calculate: coroutine function calculating values of molecules in a single ePaDEL run
+        :param max_jvms: maximum number of concurrent ePaDEL processes
+        :param max_batch_size: maximum number of molecules of coalesced requests
+        """
+        self.calculate = calculate
+        self.max_batch_size = max_batch_size
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(max_jvms)
+        self._pending: Deque[Tuple[List[Chem.Mol], asyncio.Future]] = deque()
+        self._dispatching = False
+        self._tasks = set()
+
+    async def submit(self, mols: List[Chem.Mol]) -> pd.DataFrame:
+        """Calculate values of molecules, possibly alongside those of other requests.
+
+        :param mols: molecules of the request
+        :return: values of the molecules of the request
+        """
+        # Data types of the values of no molecule cannot be obtained from those of other requests
+        if not len(mols):
+            return await self.calculate(mols)
+        future = self.loop.create_future()
+        self._pending.append((mols, future))
+        if not self._dispatching:
+            self._dispatching = True
+            self._start(self._dispatch())
+        return await future
+
+    def _start(self, coroutine: Awaitable) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference to it until it is done."""
+        task = self.loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _dispatch(self) -> None:
+        """Start an ePaDEL run for pending requests whenever a JVM is available."""
+        try:
+            while len(self._pending):
+                await self._semaphore.acquire()
+                # Coalesce pending requests that were not cancelled
+                batch, size = [], 0
+                while len(self._pending) and (not len(batch) or
+                                              size + len(self._pending[0][0]) <= self.max_batch_size):
+                    mols, future = self._pending.popleft()
+                    if not future.done():
+                        batch.append((mols, future))
+                        size += len(mols)
+                if not len(batch):
+                    self._semaphore.release()
+                    continue
+                task = self._start(self._run(batch))
+                for _, future in batch:
+                    future.add_done_callback(lambda _, task=task, batch=batch: self._abandon(task, batch))
+        finally:
+            self._dispatching = False
+
+    @staticmethod
+    def _abandon(task: asyncio.Task, batch: List[Tuple[List[Chem.Mol], asyncio.Future]]) -> None:
+        """Cancel an ePaDEL run once all its requests were cancelled."""
+        if all(future.cancelled() for _, future in batch):
+            task.cancel()
+
+    async def _run(self, batch: List[Tuple[List[Chem.Mol], asyncio.Future]]) -> None:
+        """Calculate values of coalesced requests and dispatch them to each request."""
+        try:
+            try:
+                values = await self.calculate([mol for mols, _ in batch for mol in mols])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Isolate the failing request
+                if len(batch) == 1:
+                    raise
+                for mols, future in batch:
+                    await self._run_alone(mols, future)
+                return
+            offset = 0
+            for mols, future in batch:
+                if not future.done():
+                    future.set_result(take_rows(values, offset, offset + len(mols)))
+                offset += len(mols)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._semaphore.release()
+
+    async def _run_alone(self, mols: List[Chem.Mol], future: asyncio.Future) -> None:
+        """Calculate values of a single request."""
+        if future.done():
+            return
+        try:
+            values = await self.calculate(mols)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(values)
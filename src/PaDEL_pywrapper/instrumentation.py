@@ -0,0 +1,113 @@
+# -*- coding: utf-8
+
+"""Instrumentation of the stages of descriptor calculations."""
+
+import contextlib
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from .scheduling import SchedulingStats
+
+
+class CalculationStats(SchedulingStats):
+    """Time spent in each stage of calculations and counters, aggregated across worker processes.
+
+    Stages are:
+        - 'java_resolution': locating (or installing) the Java Runtime Environment,
+        - 'reading': reading and parsing molecules of files or SMILES (calculate_file and calculate_smiles),
+        - 'preparation': checking molecules and computing their 2D coordinates,
+        - 'embedding': generating 3D conformers of molecules lacking them (part of 'preparation'),
+        - 'serialization': writing molecules in the SD format,
+        - 'names': obtaining the names of values,
+        - 'jvm': running ePaDEL (JVM startup, calculation and transfer of values),
+        - 'parsing': parsing the output of ePaDEL.
+
+    Counters are 'molecules', 'skipped', 'failures' (fingerprints that could not be calculated), 'jvm_launches',
+    'jvm_failures' (JVMs that hung or crashed), 'embedding_failures' (molecules that could not be embedded in 3D),
+    'bytes_sent' (not counted when molecules are streamed to ePaDEL) and 'bytes_received'.
+    Stages may overlap when molecules are streamed to ePaDEL or calculations are pipelined.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float], None]] = None) -> None:
+        """Instantiate empty statistics.
+
+        :param callback: function called with the name of a stage and its duration in seconds
+         each time a stage of the calling process completes
+        """
+        super().__init__()
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.java_timings: Dict[str, float] = {}
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        """Do not pickle the lock nor the callback."""
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['callback'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Restore the lock."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time a stage of the calculation.
+
+        :param stage: name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """Add time spent in a stage.
+
+        :param stage: name of the stage
+        :param seconds: time spent in seconds
+        """
+        with self._lock:
+            self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def count(self, counter: str, n: int = 1) -> None:
+        """Increment a counter.
+
+        :param counter: name of the counter
+        :param n: increment
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + int(n)
+
+    def add_java_timing(self, calculator: str, seconds: float) -> None:
+        """Add time spent by ePaDEL in a descriptor or fingerprint calculator.
+
+        :param calculator: name of the class of the calculator (e.g. CDK_WalkCountDescriptor)
+        :param seconds: time spent in seconds
+        """
+        with self._lock:
+            self.java_timings[calculator] = self.java_timings.get(calculator, 0.0) + seconds
+
+    def merge(self, other: 'CalculationStats') -> None:
+        """Add the statistics of another process.
+
+        :param other: statistics to be added
+        """
+        for stage, seconds in other.timers.items():
+            self.add_time(stage, seconds)
+        for counter, n in other.counters.items():
+            self.count(counter, n)
+        for calculator, seconds in other.java_timings.items():
+            self.add_java_timing(calculator, seconds)
+
+    def __repr__(self) -> str:
+        """Summarize statistics."""
+        return (f'CalculationStats(timers={ {stage: round(seconds, 3) for stage, seconds in self.timers.items()} }, '
+                f'counters={self.counters}, workers={len(self.busy_time)})')
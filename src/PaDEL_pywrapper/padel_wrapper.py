@@ -2,13 +2,21 @@
 
 """Python wrapper for PaDEL descriptors"""
 
+import asyncio
+import contextlib
+import hashlib
 import io
 import multiprocessing
 import os
+import queue
+import sys
+import threading
+import time
 import warnings
-from copy import deepcopy
+from collections import deque
+from copy import copy, deepcopy
 from subprocess import PIPE, Popen
-from typing import Iterable, List, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import more_itertools
 import numpy as np
@@ -18,31 +26,111 @@ from rdkit import Chem
 from rdkit.Chem import AllChem
 
 from . import descriptor as descriptor_types
+from .assembler import ResultAssembler
+from .cache import DescriptorCache
+from .conformers import ConformerGenerator
+from .dispatcher import AsyncDispatcher
+from .instrumentation import CalculationStats
 from .descriptor import Descriptor, Fingerprint
-from .utils import install_java, mktempfile, needsHs
+from .scheduling import SchedulingStats, balanced_chunks, estimate_cost
+from .server import get_server
+from .utils import (get_cache_dir, index_records, install_java, is_sd_file, jar_digest, java_version,
+                    missing_hydrogens, mktempfile, molecule_key, parse_records, parse_smiles, read_range, read_records,
+                    warm_up_java)
+
+# Path to the ePaDEL executable
+_EPADEL_PATH = os.path.abspath(os.path.join(__file__, os.pardir, 'PaDEL-Descriptor', 'lib', 'ePaDEL.jar'))
+# Names of values already obtained by the current process
+_names: Dict[str, str] = {}
 
 
 class PaDEL:
     """PaDEL wrapper to obtain molecular descriptors."""
 
     lock = multiprocessing.RLock() # Ensure installation of JRE is thread safe
+    # Data types halving the memory footprint of values
+    COMPACT_DTYPES = {'descriptors': np.float32, 'bits': np.uint8, 'counts': np.uint16}
+    # Maximum number of molecules of requests coalesced by acalculate
+    MAX_COALESCED = 1000
 
-    def __init__(self, descriptors: List[Union[Descriptor, Fingerprint]], ignore_3D: bool = True) -> None:
+    def __init__(self, descriptors: List[Union[Descriptor, Fingerprint]], ignore_3D: bool = True,
+                 persistent: bool = False, output_format: str = 'text',
+                 cache: Optional[DescriptorCache] = None, stream_input: bool = False, add_hs: bool = False,
+                 dtypes: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                 molecule_timeout: Optional[float] = None, hang_timeout: Optional[float] = None,
+                 max_jvms: Optional[int] = None, conformers: Optional[ConformerGenerator] = None) -> None:
         """Instantiate a wrapper to calculate PaDEL molecular descriptors.
 
         :param descriptors: list of descriptors or fingerprints to be calculated
         :param ignore_3D: remove descriptors requiring 3D molecular coordinates from the provided list
+        :param persistent: if True, keep one ePaDEL server alive per process and reuse it across calls
+         instead of starting a new Java Virtual Machine for each of them
+        :param output_format: format of values sent by ePaDEL; one of {'text', 'binary'}.
+         Binary output avoids parsing text: descriptors are obtained as float64, fingerprint bits as uint8 and
+         fingerprint counts as int32.
+        :param cache: on-disk cache of descriptor values; only molecules missing from it are calculated.
+         Values obtained with a cache are float64. Not supported by acalculate.
+        :param stream_input: if True, write molecules to the standard input of ePaDEL while its output is being read
+         instead of going through a temporary SD file
+        :param add_hs: if True, add missing hydrogen atoms to molecules (with coordinates) before calculation
+         instead of warning that they lack some
+        :param dtypes: data types of values, indexed by kind ('descriptors', 'bits' or 'counts'), e.g.
+         PaDEL.COMPACT_DTYPES; kinds not specified keep the data type they are parsed as
+        :param timeout: maximum time in seconds spent by each descriptor or fingerprint calculator on a molecule,
+         values being NaN beyond
+        :param molecule_timeout: maximum time in seconds spent calculating all values of a molecule,
+         values of the remaining calculators being NaN beyond
+        :param hang_timeout: time in seconds without any output after which ePaDEL is considered hung (including
+         the start of the Java Virtual Machine); it is then stopped and restarted on the remaining molecules,
+         values of the molecule being processed being NaN (ignored if persistent; not supported by acalculate)
+        :param max_jvms: maximum number of concurrent ePaDEL processes started by acalculate
+         (default: number of CPUs)
+        :param conformers: generator of 3D conformers of molecules lacking them, embedded by the process preparing
+         their chunk (ignored unless 3D descriptors are calculated); molecules that cannot be embedded are skipped
         """
+        if output_format not in ['text', 'binary']:
+            raise ValueError(f'output format {output_format} is not supported.')
+        dtypes = dict(dtypes or {})
+        for kind, dtype in dtypes.items():
+            if kind not in ['descriptors', 'bits', 'counts']:
+                raise ValueError(f'kind of values {kind} is not supported.')
+            if np.dtype(dtype).kind not in 'iuf':
+                raise ValueError(f'data type {dtype} of {kind} is not numeric.')
+        for name, value in [('timeout', timeout), ('molecule_timeout', molecule_timeout),
+                            ('hang_timeout', hang_timeout)]:
+            if value is not None and value <= 0:
+                raise ValueError(f'{name} must be positive.')
+        if max_jvms is not None and max_jvms < 1:
+            raise ValueError('max_jvms must be at least 1.')
         # Ensure descriptors are actual PaDEL descriptors
         names = ([descriptor.name for descriptor in descriptor_types.descriptors] +
                  [fingerprint.name for fingerprint in descriptor_types._fingerprints])
         for descriptor in descriptors:
             if descriptor.name not in names and not isinstance(descriptor, (Descriptor, Fingerprint)):
                 raise ValueError(f'descriptor {descriptor} is not a valid PaDEL descriptor.')
+        # Values of fingerprints are named after their type, regardless of their size
+        prefixes = [descriptor.bit_prefix for descriptor in descriptors if not isinstance(descriptor, Descriptor)]
+        duplicates = sorted({prefix for prefix in prefixes if prefixes.count(prefix) > 1})
+        if len(duplicates):
+            raise ValueError(f'fingerprints {", ".join(duplicates)} are requested more than once.')
 
         self.descriptors = []
         self.fingerprints = []
         self._ignore_3D = ignore_3D
+        self.persistent = persistent
+        self.output_format = output_format
+        self.cache = cache
+        self.stream_input = stream_input
+        self.add_hs = add_hs
+        self.dtypes = dtypes
+        self.timeout = timeout
+        self.molecule_timeout = molecule_timeout
+        self.hang_timeout = hang_timeout
+        self.max_jvms = max_jvms or os.cpu_count() or 1
+        self.conformers = conformers
+        self._stats = None
+        self._dispatcher = None
+        self._java = None
         self.has_3D_descriptors = False
         # Remove 3D descriptors if required
         for descriptor in descriptors:
@@ -54,37 +142,352 @@ class PaDEL:
                     self.has_3D_descriptors = True
             else:
                 self.fingerprints.append(descriptor)
-        # Keep registry of desc names to keep
-        self.desc_kept = []
-        for desc in self.descriptors:
-            # Add all subdescs names
-            self.desc_kept.extend(desc.subcomponents)
 
     def calculate(self, mols: Iterable[Chem.Mol], show_banner: bool = True, njobs: int = 1,
-                  chunksize: int = 100) -> pd.DataFrame:
+                  chunksize: int = 100, deduplicate: bool = False, java_threads: int = 1,
+                  schedule: str = 'fixed', stats: Optional[SchedulingStats] = None,
+                  pipeline: bool = False, fingerprint_format: str = 'dense'
+                  ) -> Union[pd.DataFrame, Tuple[pd.DataFrame, Dict[str, Any]]]:
         """Calculate PaDEL descriptors.
 
         :param mols: RDKit molecules for which PaDEL descriptors should be calculated
         :param show_banner: If True, show notice on PaDEL descriptors usage
         :param njobs: number of concurrent processes
         :param chunksize: number of molecules to be processed by a process; ignored if njobs is 1
-        :return: a pandas DataFrame containing all PaDEL descriptor values
+        :param deduplicate: If True, calculate descriptors of identical molecules only once
+        :param java_threads: number of threads of each ePaDEL process calculating descriptors of molecules
+         concurrently
+        :param schedule: distribution of molecules across processes; one of {'fixed', 'balanced'}.
+         'fixed' splits molecules into consecutive chunks of chunksize molecules, 'balanced' groups molecules
+         into chunks of similar estimated cost (based on atoms, rings and the requested descriptors);
+         ignored if njobs is 1
+        :param stats: statistics to be updated with the busy time of each process (ignored if njobs is 1);
+         CalculationStats also collect the time spent in each stage and counters, aggregated across processes
+        :param pipeline: If True, split molecules into chunks of chunksize molecules and prepare the next chunk
+         while ePaDEL calculates the current one and the values of the previous one are parsed;
+         ignored if njobs > 1
+        :param fingerprint_format: format of fingerprints; one of {'dense', 'packed', 'sparse'}.
+         'dense' returns fingerprints alongside descriptors in a single DataFrame,
+         'packed' returns fingerprint bits as uint8 arrays packed with numpy.packbits (8 bits per byte) and
+         'sparse' returns fingerprint bits as boolean scipy.sparse CSR matrices.
+         With 'packed' and 'sparse', count fingerprints are obtained as int32 scipy.sparse CSR matrices,
+         and fingerprints that could not be calculated are empty rows.
+        :return: a pandas DataFrame containing all PaDEL descriptor values, or if fingerprint_format is not 'dense',
+         a tuple of a pandas DataFrame containing descriptor values and a dictionary of the fingerprints
+         indexed by their short name (e.g. 'PubchemFP')
         """
+        if schedule not in ['fixed', 'balanced']:
+            raise ValueError(f'schedule {schedule} is not supported.')
+        if fingerprint_format not in ['dense', 'packed', 'sparse']:
+            raise ValueError(f'fingerprint format {fingerprint_format} is not supported.')
         if show_banner:
             self._show_banner()
+        self._stats = stats if isinstance(stats, CalculationStats) else None
+        # Keep fingerprints compact
+        if fingerprint_format != 'dense':
+            if self.cache is not None or deduplicate:
+                raise ValueError(f'fingerprint format {fingerprint_format} cannot be used with a cache '
+                                 'or deduplication.')
+            return self._calculate_compact(mols, fingerprint_format, njobs, chunksize, java_threads)
+        # Calculate only molecules missing from the cache
+        if self.cache is not None:
+            return self._calculate_cached(list(mols), njobs=njobs, chunksize=chunksize, java_threads=java_threads,
+                                          schedule=schedule, stats=stats, pipeline=pipeline)
+        # Calculate only unique molecules
+        if deduplicate:
+            return self._calculate_deduplicated(list(mols), njobs=njobs, chunksize=chunksize,
+                                                java_threads=java_threads, schedule=schedule, stats=stats,
+                                                pipeline=pipeline)
         # Parallelize should need be
+        if njobs > 1 and schedule == 'balanced':
+            result = self._calculate_balanced(list(mols), njobs, chunksize, java_threads, stats)
+        elif njobs > 1 or pipeline:
+            # Collect results
+            results = list(self.iter_calculate(mols, show_banner=False, njobs=njobs, chunksize=chunksize,
+                                               java_threads=java_threads, stats=stats, pipeline=pipeline))
+            result = pd.concat(results).reset_index(drop=True) if len(results) else self._calculate([])
+        else:
+            # Single process
+            result = self._calculate(list(mols), java_threads)
+        return result
+
+    async def acalculate(self, mols: Iterable[Chem.Mol], show_banner: bool = True) -> pd.DataFrame:
+        """Calculate PaDEL descriptors without blocking the running event loop.
+
+        At most max_jvms ePaDEL processes run concurrently; requests waiting for one to be available are
+        coalesced into a single ePaDEL run of up to PaDEL.MAX_COALESCED molecules.
+        Cancelling the calculation stops its ePaDEL process, unless it is shared with other requests.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :return: a pandas DataFrame containing all PaDEL descriptor values
+        """
+        if self.cache is not None or self.hang_timeout is not None:
+            raise ValueError('acalculate supports neither cache nor hang_timeout.')
+        if show_banner:
+            self._show_banner()
+        # Requests of an event loop share their dispatcher
+        if self._dispatcher is None or self._dispatcher.loop is not asyncio.get_running_loop():
+            self._dispatcher = AsyncDispatcher(self._acalculate, self.max_jvms, self.MAX_COALESCED)
+        return await self._dispatcher.submit(list(mols))
+
+    async def _acalculate(self, mols: List[Chem.Mol]) -> pd.DataFrame:
+        """Calculate PaDEL descriptors in a single ePaDEL run without blocking the running event loop.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        """
+        loop = asyncio.get_running_loop()
+        # Copy self instance as concurrent runs have their own molecules and temporary file
+        padel = copy(self)
+        padel._stats = None
+        # Check molecules and write them in a thread
+        prepare = loop.run_in_executor(None, padel._prepare_command, mols)
+        try:
+            commands = await asyncio.shield(prepare)
+        except asyncio.CancelledError:
+            # Remove the temporary file once written
+            prepare.add_done_callback(lambda future: padel._cleanup()
+                                      if not future.cancelled() and future.exception() is None else None)
+            raise
+        try:
+            # Names are memoized once obtained
+            names = await loop.run_in_executor(None, padel._run_names, commands[0])
+            if not len(padel._molecules):
+                # No molecule to be calculated (e.g. all of them were skipped)
+                values = b''
+            elif self.persistent:
+                values = await loop.run_in_executor(None, padel._run_values, commands[1])
+            else:
+                # Serialize molecules to be streamed to ePaDEL in a thread
+                molecules = await loop.run_in_executor(None, padel._read_molecules) if self.stream_input else None
+                process = await asyncio.create_subprocess_exec(
+                    *padel._command_prefix, *commands[1], '-i', '-' if self.stream_input else padel._tmp_sd,
+                    stdin=PIPE if self.stream_input else None, stdout=PIPE)
+                try:
+                    values, _ = await process.communicate(molecules)
+                except asyncio.CancelledError:
+                    process.kill()
+                    # Reap the killed process
+                    await process.wait()
+                    raise
+                if process.returncode != 0 or padel._complete_rows(values)[0] < len(padel._molecules):
+                    raise RuntimeError('ePaDEL crashed without calculating values of all molecules.')
+            return await loop.run_in_executor(None, padel._parse_values, values, names)
+        finally:
+            padel._cleanup()
+
+    def iter_calculate(self, mols: Iterable[Chem.Mol], show_banner: bool = True, njobs: int = 1,
+                       chunksize: int = 100, max_pending: Optional[int] = None,
+                       java_threads: int = 1, stats: Optional[SchedulingStats] = None,
+                       pipeline: bool = False) -> Iterator[pd.DataFrame]:
+        """Lazily calculate PaDEL descriptors, one chunk of molecules at a time.
+
+        Molecules are consumed from the iterable only as chunks are submitted,
+        so that memory usage does not depend on the number of molecules.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :param njobs: number of concurrent processes
+        :param chunksize: number of molecules of each chunk
+        :param max_pending: maximum number of chunks being calculated or waiting to be yielded (default: 2 * njobs),
+         or waiting between two stages of the pipeline (default: 2)
+        :param java_threads: number of threads of each ePaDEL process calculating descriptors of molecules
+         concurrently
+        :param stats: statistics to be updated with the busy time of each process (ignored if njobs is 1);
+         CalculationStats also collect the time spent in each stage and counters, aggregated across processes
+        :param pipeline: If True, prepare the next chunk while ePaDEL calculates the current one and
+         the values of the previous one are parsed; ignored if njobs > 1
+        :return: pandas DataFrames containing the PaDEL descriptor values of consecutive chunks,
+         in input order and indexed by the position of molecules in the input
+        """
+        if show_banner:
+            self._show_banner()
+        self._stats = stats if isinstance(stats, CalculationStats) else None
+        chunks = more_itertools.batched(mols, chunksize)
+        offset = 0
         if njobs > 1:
+            max_pending = max_pending or 2 * njobs
+            # Resolve Java once for all processes
+            self._resolve_java()
             with BoundedProcessPoolExecutor(max_workers=njobs) as worker:
-                futures = [worker.submit(self._multiproc_calculate, list(chunk))
-                           for chunk in more_itertools.batched(mols, chunksize)
-                           ]
-            # Collect results
-            result = pd.concat([future.result() for future in futures]).reset_index(drop=True)
+                pending = deque()
+                for chunk in chunks:
+                    pending.append((offset, worker.submit(self._timed_calculate, list(chunk), java_threads,
+                                                                 self._stats is not None)))
+                    offset += len(chunk)
+                    # Wait for the oldest chunk should too many be in flight
+                    if len(pending) >= max_pending:
+                        start, future = pending.popleft()
+                        yield self._set_offset(self._collect(future, stats), start)
+                while len(pending):
+                    start, future = pending.popleft()
+                    yield self._set_offset(self._collect(future, stats), start)
+        elif pipeline:
+            # Single process, overlapping stages
+            for chunk in self._iter_pipelined(chunks, max_pending or 2, java_threads):
+                yield self._set_offset(chunk, offset)
+                offset += len(chunk)
         else:
             # Single process
-            result = self._calculate(list(mols))
+            for chunk in chunks:
+                yield self._set_offset(self._calculate(list(chunk), java_threads), offset)
+                offset += len(chunk)
+
+    def _iter_pipelined(self, chunks: Iterable[List[Chem.Mol]], max_pending: int,
+                        java_threads: int) -> Iterator[pd.DataFrame]:
+        """Calculate PaDEL descriptors of chunks in three overlapping stages.
+
+        A thread prepares chunks (checks and SD serialization), another runs ePaDEL on them
+        and the values are parsed by the calling thread.
+
+        :param chunks: chunks of RDKit molecules for which PaDEL descriptors should be calculated
+        :param max_pending: maximum number of chunks waiting between two stages
+        :param java_threads: number of threads of ePaDEL
+        :return: pandas DataFrames containing the PaDEL descriptor values of chunks, in input order
+        """
+        prepared, calculated = queue.Queue(max_pending), queue.Queue(max_pending)
+        stop = threading.Event()
+        done = object()
+
+        def put(stage_queue: queue.Queue, item) -> None:
+            # Give up should the consumer have stopped
+            while not stop.is_set():
+                try:
+                    stage_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def get(stage_queue: queue.Queue):
+            # Give up should the consumer have stopped
+            while not stop.is_set():
+                try:
+                    return stage_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return done
+
+        def prepare() -> None:
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    # Each chunk has its own temporary file and skipped molecules
+                    padel = copy(self)
+                    commands = padel._prepare_command(list(chunk))
+                    if java_threads > 1:
+                        commands = commands[0], commands[1] + ['--threads', str(java_threads)]
+                    put(prepared, (padel, commands))
+                put(prepared, done)
+            except Exception as e:
+                put(prepared, e)
+
+        def run() -> None:
+            while True:
+                item = get(prepared)
+                if item is done or isinstance(item, Exception):
+                    put(calculated, item)
+                    return
+                padel, commands = item
+                try:
+                    names = padel._run_names(commands[0])
+                    values = padel._run_values(commands[1])
+                except Exception as e:
+                    put(calculated, e)
+                    return
+                finally:
+                    padel._cleanup()
+                put(calculated, (padel, names, values))
+
+        threads = [threading.Thread(target=prepare, daemon=True), threading.Thread(target=run, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = calculated.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                padel, names, values = item
+                yield padel._parse_values(values, names)
+        finally:
+            stop.set()
+            # Free temporary files of chunks prepared but not calculated
+            while not prepared.empty():
+                item = prepared.get()
+                if isinstance(item, tuple):
+                    item[0]._cleanup()
+
+    def _calculate_balanced(self, mols: List[Chem.Mol], njobs: int, chunksize: int, java_threads: int,
+                            stats: Optional[SchedulingStats]) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of chunks of molecules of similar estimated cost on multiple processes.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param njobs: number of concurrent processes
+        :param chunksize: average number of molecules of each chunk
+        :param java_threads: number of threads of each ePaDEL process
+        :param stats: statistics to be updated with the busy time of each process
+        """
+        if not len(mols):
+            return self._calculate([])
+        costs = [estimate_cost(mol, self.descriptors + self.fingerprints) for mol in mols]
+        # At least one chunk per process
+        n_chunks = max(njobs, -(-len(mols) // chunksize))
+        chunks = balanced_chunks(costs, n_chunks)
+        # Resolve Java once for all processes
+        self._resolve_java()
+        with BoundedProcessPoolExecutor(max_workers=njobs) as worker:
+            futures = [worker.submit(self._timed_calculate, [mols[i] for i in chunk], java_threads,
+                                     self._stats is not None)
+                       for chunk in chunks]
+            results = []
+            for chunk, future in zip(chunks, futures):
+                result = self._collect(future, stats)
+                result.index = chunk
+                results.append(result)
+        # Restore input order
+        return pd.concat(results).sort_index().reset_index(drop=True)
+
+    @staticmethod
+    def _collect(future, stats: Optional[SchedulingStats]) -> pd.DataFrame:
+        """Obtain the values calculated by a process and record its busy time and statistics."""
+        pid, busy_time, result, worker_stats = future.result()
+        if stats is not None:
+            stats.record(pid, busy_time, len(result))
+        if worker_stats is not None:
+            stats.merge(worker_stats)
+        return result
+
+    @staticmethod
+    def _set_offset(result: pd.DataFrame, offset: int) -> pd.DataFrame:
+        """Index the values of a chunk by the position of its molecules in the input."""
+        result.index = pd.RangeIndex(offset, offset + len(result))
         return result
 
+    def __getstate__(self) -> dict:
+        """Do not pickle the dispatcher of asynchronous calculations."""
+        state = self.__dict__.copy()
+        state['_dispatcher'] = None
+        return state
+
+    def warm_up(self, java: Optional[str] = None) -> None:
+        """Install and verify the Java Runtime Environment and obtain names of values before starting processes.
+
+        :param java: path to a Java executable or to a Java home to be used by this instance (and by its copies
+         in worker processes) instead of the JRE installed by PaDEL_pywrapper or set by PADEL_PYWRAPPER_JAVA
+        """
+        with self.lock:
+            self._java = warm_up_java(java)
+        self._run_names(self._create_command()[0])
+
+    def _resolve_java(self) -> str:
+        """Obtain the path to the Java executable, resolved once per process unless set by warm_up."""
+        if self._java is not None:
+            return self._java
+        with self._timer('java_resolution'), self.lock:
+            return install_java()
+
     def _show_banner(self):
         """Print info message for citing."""
         print("""PaDEL-Descriptor is a software for calculating molecular
@@ -104,137 +507,948 @@ J. Comput. Chem., 32: 1466-1474. https://doi.org/10.1002/jcc.21707
 ###################################
 """)
 
-    def _prepare_command(self, mols: List[Chem.Mol]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
-        """Create the ePaDEL command to be run to obtain molecular descriptors.
+    def _prepare_command(self, mols: List[Chem.Mol]) -> Tuple[List[str], List[str]]:
+        """Create the ePaDEL arguments to be run to obtain molecular descriptors.
+
+        Descriptors and fingerprints are all obtained from a single pass of ePaDEL over the molecules.
 
         :param mols: molecules to obtained molecular descriptors of
-        :return: The command to run.
+        :return: The arguments of the commands to run (names and values).
         """
-        # 1) Ensure JRE is accessible
-        with self.lock:
-            self._java_path = install_java()
+        # 1) Ensure molecules can be processed
+        self._skipped = []
+        with self._timer('preparation'):
+            molecules = list(self._check_molecules(mols))
+        self._count('molecules', len(molecules))
+        self._count('skipped', len(self._skipped))
+        # Keep molecules in memory to be streamed to ePaDEL or retried
+        self._molecules = molecules
+        # 2) Stream molecules to ePaDEL
+        if self.stream_input:
+            self._tmp_sd = None
+            return self._create_command()
         # 2) Create temp SD v2k file
         self._tmp_sd = mktempfile('molecules_v2k.sd')
-        self._skipped = []
-        try:
-            writer = Chem.SDWriter(self._tmp_sd)
-            # Ensure V2000 as CDK cannot properly process v3000
-            writer.SetForceV3000(False)
-            for i, mol in enumerate(mols):
-                if mol is not None and isinstance(mol, Chem.Mol):
-                    if mol.GetNumAtoms() > 999:
-                        raise ValueError('Cannot calculate descriptors for molecules with more than 999 atoms.')
-                    # Does molecule lack hydrogen atoms?
-                    if needsHs(mol):
-                        warnings.warn('Molecule lacks hydrogen atoms: this will affect the value of calculated descriptors')
-                    # If molecule has no conformer
-                    confs = list(mol.GetConformers())
-                    if not (len(confs) > 0 and confs[-1].Is3D()):
-                        if self.has_3D_descriptors:
-                            raise ValueError('Cannot calculate descriptors for a conformer-less molecule')
+        with self._timer('serialization'):
+            self._write_molecules(molecules, self._tmp_sd)
+        self._count('bytes_sent', os.path.getsize(self._tmp_sd))
+        # 3) Create commands
+        return self._create_command()
+
+    def _timer(self, stage: str) -> contextlib.AbstractContextManager:
+        """Time a stage of the calculation should statistics be collected.
+
+        :param stage: name of the stage
+        """
+        if self._stats is None:
+            return contextlib.nullcontext()
+        return self._stats.timer(stage)
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        """Increment a counter should statistics be collected.
+
+        :param counter: name of the counter
+        :param n: increment
+        """
+        if self._stats is not None:
+            self._stats.count(counter, n)
+
+    def _check_molecules(self, mols: List[Chem.Mol]) -> Iterator[Chem.Mol]:
+        """Ensure molecules can be processed by ePaDEL and record the position of invalid ones.
+
+        :param mols: molecules to obtained molecular descriptors of
+        :return: the valid molecules
+        """
+        # Molecules embedded in 3D are given hydrogen atoms
+        embed = self.conformers is not None and self.has_3D_descriptors
+        lacking_hs = missing_hydrogens(mols)
+        if embed:
+            lacking_hs[[i for i, mol in enumerate(mols) if isinstance(mol, Chem.Mol) and not self._is_3D(mol)]] = 0
+        # Do molecules lack hydrogen atoms?
+        lacking_hs = np.flatnonzero(lacking_hs)
+        if len(lacking_hs) and not self.add_hs:
+            warnings.warn(f'{len(lacking_hs)} molecule(s) lack hydrogen atoms (positions in batch: '
+                          f'{", ".join(map(str, lacking_hs[:10]))}{", ..." if len(lacking_hs) > 10 else ""}): '
+                          'this will affect the value of calculated descriptors')
+        lacking_hs = set(lacking_hs.tolist()) if self.add_hs else set()
+        failed = []
+        for i, mol in enumerate(mols):
+            if mol is not None and isinstance(mol, Chem.Mol):
+                if i in lacking_hs:
+                    mol = Chem.AddHs(mol, addCoords=True)
+                # If molecule has no conformer
+                if not self._is_3D(mol):
+                    if embed:
+                        with self._timer('embedding'):
+                            mol = self.conformers.embed(mol)
+                        if mol is None:
+                            failed.append(i)
+                            self._skipped.append(i)
+                            continue
+                    elif self.has_3D_descriptors:
+                        raise ValueError('Cannot calculate descriptors for a conformer-less molecule')
+                    else:
                         # If no 3D descriptor, compute 2D coords
                         AllChem.Compute2DCoords(mol)
-                    writer.write(mol)
-                else:
-                    self._skipped.append(i)
-            writer.close()
-        except ValueError as e:
-            # Free resources and raise error
+                if mol.GetNumAtoms() > 999:
+                    raise ValueError('Cannot calculate descriptors for molecules with more than 999 atoms.')
+                yield mol
+            else:
+                self._skipped.append(i)
+        if len(failed):
+            self._count('embedding_failures', len(failed))
+            warnings.warn(f'{len(failed)} molecule(s) could not be embedded in 3D (positions in batch: '
+                          f'{", ".join(map(str, failed[:10]))}{", ..." if len(failed) > 10 else ""}): '
+                          'their values are NaN')
+
+    @staticmethod
+    def _is_3D(mol: Chem.Mol) -> bool:
+        """Whether the last conformer of a molecule has 3D coordinates."""
+        return mol.GetNumConformers() > 0 and mol.GetConformers()[-1].Is3D()
+
+    @staticmethod
+    def _write_molecules(mols: Iterable[Chem.Mol], output: Union[str, io.TextIOBase]) -> None:
+        """Write molecules in the V2000 SD format.
+
+        :param mols: molecules to be written
+        :param output: path to the SD file or text stream to write molecules to
+        """
+        writer = Chem.SDWriter(output)
+        # Ensure V2000 as CDK cannot properly process v3000
+        writer.SetForceV3000(False)
+        try:
+            for mol in mols:
+                writer.write(mol)
+        finally:
             writer.close()
-            os.remove(self._tmp_sd)
-            raise e from None
-        # 3) Create commands
-        desc_commands = []
-        fp_commands = []
-        java_path = install_java()
-        epadel_path = os.path.abspath(os.path.join(__file__, os.pardir, 'PaDEL-Descriptor', 'lib', 'ePaDEL.jar'))
-        command_prefix = f"{java_path} -Djava.awt.headless=true -jar {epadel_path}"
+
+    def _read_molecules(self) -> bytes:
+        """Obtain the content of the V2000 SD file of molecules."""
+        if self._tmp_sd is not None:
+            with open(self._tmp_sd, 'rb') as molecules:
+                return molecules.read()
+        buffer = io.BytesIO()
+        with io.TextIOWrapper(buffer, encoding='utf-8', write_through=True) as stream:
+            self._write_molecules(self._molecules, stream)
+            return buffer.getvalue()
+
+    def _create_command(self) -> Tuple[List[str], List[str]]:
+        """Create the ePaDEL arguments to be run to obtain names and values of molecular descriptors."""
+        command = []
+        self._command_prefix = [self._resolve_java(), '-Djava.awt.headless=true', '-jar', _EPADEL_PATH]
         # Create commands for descriptors
         if len(self.descriptors):
-            command_names = f"{command_prefix} -d --names"
-            command_values = f"{command_prefix} -d -i {self._tmp_sd}"
+            # Calculate only selected descriptors
+            selection = ','.join(desc.name for desc in self.descriptors)
+            command.extend(['-d', '-s', selection])
             if not self._ignore_3D:
-                command_names += ' -3D'
-                command_values += ' -3D'
-            desc_commands.append((command_names, command_values))
+                command.append('-3D')
         # Create commands for fingerprints
         if len(self.fingerprints):
+            fp_values = []
             for fp in self.fingerprints:
-                command_names = f"{command_prefix} -f {fp.bit_prefix} --names"
-                command_values = f"{command_prefix} -f {fp.bit_prefix} -i {self._tmp_sd}"
                 # Add additional parameters
                 if hasattr(fp, 'size'):
-                    command_names += f" -nBits {fp.nBits} -searchDepth {fp.searchDepth}"
-                    command_values += f" -nBits {fp.nBits} -searchDepth {fp.searchDepth}"
-                fp_commands.append((command_names, command_values))
-        return desc_commands, fp_commands
+                    fp_values.append(f'{fp.bit_prefix}:{fp.nBits}:{fp.searchDepth}')
+                else:
+                    fp_values.append(fp.bit_prefix)
+            command.extend(['-f', ','.join(fp_values)])
+        # Time budgets in milliseconds
+        values_command = command.copy()
+        if self.timeout is not None:
+            values_command.extend(['--timeout', str(max(1, round(self.timeout * 1000)))])
+        if self.molecule_timeout is not None:
+            values_command.extend(['--moleculeTimeout', str(max(1, round(self.molecule_timeout * 1000)))])
+        if self.output_format == 'binary':
+            values_command.append('--binary')
+        return command + ['--names'], values_command
 
     def _cleanup(self) -> None:
         """Cleanup resources used for calculation."""
         # Remove temporary file
-        os.remove(self._tmp_sd)
+        if self._tmp_sd is not None:
+            os.remove(self._tmp_sd)
+        self._molecules = None
 
-    def _run_command(self, commands: Tuple[str, str]) -> pd.DataFrame:
+    def _run_command(self, commands: Tuple[List[str], List[str]]) -> pd.DataFrame:
         """Run the ePaDEL command couple.
 
-        :param commands: A couple of commands to be run (names and values).
+        :param commands: A couple of ePaDEL arguments to be run (names and values).
         """
-        with Popen(commands[0].split(), stdout=PIPE) as process:
-            names = process.stdout.read().decode().split()
-        with Popen(commands[1].split(), stdout=PIPE) as process:
-            values = io.StringIO(process.stdout.read().decode())
-            values = pd.read_csv(values,
-                                 sep=' ', header=None, names=names)
+        names = self._run_names(commands[0])
+        return self._parse_values(self._run_values(commands[1]), names)
+
+    def _run_values(self, command: List[str]) -> bytes:
+        """Run the ePaDEL command obtaining values of descriptors and fingerprints.
+
+        :param command: ePaDEL arguments to be run
+        :return: the raw output of ePaDEL
+        """
+        if self.persistent:
+            with self._timer('serialization'):
+                molecules = self._read_molecules()
+            self._count('bytes_sent', len(molecules))
+            # Send requests to the ePaDEL server of this process
+            with self._timer('jvm'):
+                values = get_server(self._command_prefix).request(command, molecules)
+        else:
+            with self._timer('jvm'):
+                values = self._run_jvm(command)
+        self._count('bytes_received', len(values))
         return values
 
+    def _run_jvm(self, command: List[str]) -> bytes:
+        """Run ePaDEL on all molecules, restarting it on the remaining ones should it hang or crash.
+
+        Values of the molecule being processed when ePaDEL hung or crashed are NaN.
+
+        :param command: ePaDEL arguments to be run
+        :return: the raw output of ePaDEL
+        """
+        molecules = self._molecules
+        output = []
+        # Positions of molecules in the batch
+        positions = np.setdiff1d(np.arange(len(self._molecules) + len(self._skipped)), self._skipped)
+        crashes = 0
+        while True:
+            values, error = self._launch_jvm(command, molecules, retry=len(output) > 0)
+            n_rows, complete = self._complete_rows(values)
+            # ePaDEL exiting normally without writing values of all molecules crashed nonetheless
+            if error is None and n_rows < len(molecules):
+                error = 'crashed'
+            if error is None:
+                output.append(values)
+                break
+            # Keep values of molecules calculated before ePaDEL hung or crashed
+            output.append(complete)
+            if n_rows >= len(molecules):
+                break
+            self._count('jvm_failures')
+            # Do not restart indefinitely a JVM that cannot calculate anything
+            crashes = crashes + 1 if error == 'crashed' and n_rows == 0 else 0
+            if crashes >= 3:
+                raise RuntimeError('ePaDEL crashed repeatedly without calculating any value.')
+            position = positions[len(positions) - len(molecules) + n_rows]
+            warnings.warn(f'ePaDEL {error} while calculating values of molecule {position} of the batch: '
+                          'its values are NaN.')
+            output.append(self._missing_row())
+            molecules = molecules[n_rows + 1:]
+            if not len(molecules):
+                break
+        return b''.join(output)
+
+    def _launch_jvm(self, command: List[str], molecules: List[Chem.Mol], retry: bool = False
+                    ) -> Tuple[bytes, Optional[str]]:
+        """Run a Java Virtual Machine calculating values of molecules.
+
+        :param command: ePaDEL arguments to be run
+        :param molecules: molecules to be calculated
+        :param retry: If True, molecules differ from those of the temporary SD file, which must be rewritten
+        :return: the raw output of ePaDEL and, should it not complete, whether it 'hung' or 'crashed'
+        """
+        # Report the calculation time of each descriptor and fingerprint
+        if self._stats is not None:
+            command = command + ['--timings']
+        # Obtain values as soon as they are calculated to monitor progress
+        if self.hang_timeout is not None:
+            command = command + ['--flush']
+        if retry and not self.stream_input:
+            self._write_molecules(molecules, self._tmp_sd)
+        self._count('jvm_launches')
+        chunks, errors = [], []
+        progress = threading.Event()
+        hung = False
+        with Popen(self._command_prefix + command + ['-i', '-' if self.stream_input else self._tmp_sd],
+                   stdin=PIPE if self.stream_input else None, stdout=PIPE,
+                   stderr=PIPE if self._stats is not None else None) as process:
+            def feed():
+                try:
+                    # Closing the stream signals the end of molecules to ePaDEL
+                    with self._timer('serialization'), io.TextIOWrapper(process.stdin, encoding='utf-8') as stdin:
+                        self._write_molecules(molecules, stdin)
+                except BrokenPipeError:
+                    # ePaDEL stopped before reading all molecules
+                    pass
+
+            def read():
+                for chunk in iter(lambda: process.stdout.read1(1 << 16), b''):
+                    chunks.append(chunk)
+                    progress.set()
+                progress.set()
+            reader = threading.Thread(target=read, daemon=True)
+            threads = [reader]
+            if self.stream_input:
+                threads.append(threading.Thread(target=feed, daemon=True))
+            # Read stderr concurrently so that ePaDEL is never blocked writing to it
+            if process.stderr is not None:
+                threads.append(threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True))
+            for thread in threads:
+                thread.start()
+            # Stop ePaDEL should it not output anything for too long
+            while self.hang_timeout is not None and reader.is_alive():
+                if not progress.wait(self.hang_timeout) and reader.is_alive():
+                    process.kill()
+                    hung = True
+                    break
+                progress.clear()
+            for thread in threads:
+                thread.join()
+        self._read_timings(errors[0] if len(errors) else None)
+        if hung:
+            return b''.join(chunks), 'hung'
+        return b''.join(chunks), 'crashed' if process.returncode != 0 else None
+
+    def _complete_rows(self, values: bytes) -> Tuple[int, bytes]:
+        """Obtain the rows of values ePaDEL wrote entirely.
+
+        :param values: raw output of ePaDEL
+        :return: the number of complete rows and their raw values
+        """
+        if self.output_format == 'binary':
+            row_size = self._binary_layout(self._get_blocks(self._run_names(self._create_command()[0]))).itemsize
+            n_rows = len(values) // row_size
+            return n_rows, values[:n_rows * row_size]
+        end = values.rfind(b'\n') + 1
+        return values.count(b'\n', 0, end), values[:end]
+
+    def _missing_row(self) -> bytes:
+        """Obtain the raw values of a molecule whose values could not be calculated."""
+        blocks = self._get_blocks(self._run_names(self._create_command()[0]))
+        if self.output_format == 'binary':
+            # NaN descriptors and fingerprints whose status is 0
+            row = np.zeros(1, dtype=self._binary_layout(blocks))
+            if len(self.descriptors):
+                row['block0'] = np.nan
+            return row.tobytes()
+        return (' '.join(['NaN'] * sum(len(names) for names, _ in blocks)) + '\n').encode()
+
+    def _read_timings(self, errors: Optional[bytes]) -> None:
+        """Record the timings reported by ePaDEL and forward its other messages to stderr.
+
+        :param errors: content of the standard error of ePaDEL, if captured
+        """
+        if errors is None:
+            return
+        for line in errors.decode(errors='replace').splitlines(keepends=True):
+            if line.startswith('TIMING\t'):
+                _, calculator, nanoseconds = line.split('\t')
+                self._stats.add_java_timing(calculator, int(nanoseconds) / 1e9)
+            else:
+                sys.stderr.write(line)
+
+    def _parse_values(self, values: bytes, names: str) -> pd.DataFrame:
+        """Parse the output of ePaDEL into a table with a row for each molecule, including skipped ones.
+
+        :param values: raw output of ePaDEL
+        :param names: names of values of each block, one block per line
+        """
+        with self._timer('parsing'):
+            # Names memoized beforehand may not match the values ePaDEL writes
+            if not self._match_names(values, names):
+                command = self._create_command()[0]
+                self._forget_names(command)
+                names = self._run_names(command)
+                if not self._match_names(values, names):
+                    raise RuntimeError('ePaDEL did not write a value for each name of descriptor or fingerprint bit.')
+            return self._assemble_values(values, names)
+
+    def _match_names(self, values: bytes, names: str) -> bool:
+        """Whether each row written by ePaDEL holds as many values as there are names.
+
+        :param values: raw output of ePaDEL
+        :param names: names of values of each block, one block per line
+        """
+        blocks = self._get_blocks(names)
+        if self.output_format == 'binary':
+            return len(values) % self._binary_layout(blocks).itemsize == 0
+        # Values of a row are separated by single spaces
+        n_rows = values.count(b'\n')
+        return values.count(b' ') == n_rows * (sum(len(block_names) for block_names, _ in blocks) - 1)
+
+    def _assemble_values(self, values: bytes, names: str) -> pd.DataFrame:
+        """Parse the output of ePaDEL and write values in place (see _parse_values)."""
+        blocks = self._get_blocks(names)
+        # Values of each block and whether they could not be calculated
+        if self.output_format == 'binary':
+            rows = self._binary_rows(values, blocks)
+            parsed = [(rows[f'block{i}'], rows[f'status{i}'] == 0 if f'status{i}' in rows.dtype.names else None)
+                      for i in range(len(blocks))]
+            n_calculated = len(rows)
+        elif len(values):
+            table = pd.read_csv(io.StringIO(values.decode()),
+                                sep=' ', header=None, names=names.split())
+            bounds = np.cumsum([0] + [len(block_names) for block_names, _ in blocks])
+            parsed = [(table.iloc[:, start:end], None) for start, end in zip(bounds[:-1], bounds[1:])]
+            n_calculated = len(table)
+        else:
+            parsed = [(np.empty((0, len(block_names))), None) for block_names, _ in blocks]
+            n_calculated = 0
+        assembler = ResultAssembler(n_calculated + len(self._skipped), self._skipped)
+        for (block_names, _), kind, (block_values, failed) in zip(blocks, self._get_kinds(), parsed):
+            dtype = self.dtypes.get(kind)
+            if isinstance(block_values, pd.DataFrame):
+                # Columns parsed from text keep their own data type (e.g. integer descriptors) unless one is set
+                dtypes = block_values.dtypes.tolist() if dtype is None else [dtype] * block_values.shape[1]
+                # Runs of consecutive columns of the same data type
+                bounds = [0] + [i for i in range(1, len(dtypes)) if dtypes[i] != dtypes[i - 1]] + [len(dtypes)]
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    assembler.add(block_names[start:end], block_values.iloc[:, start:end].to_numpy(), dtype)
+            else:
+                assembler.add(block_names, block_values, dtype, failed)
+            # Fingerprints that could not be calculated
+            if kind != 'descriptors':
+                if failed is None:
+                    failed = np.asarray(pd.isna(block_values)).any(axis=1)
+                self._count('failures', np.count_nonzero(failed))
+        return assembler.to_frame()
+
+    def _run_names(self, command: List[str]) -> str:
+        """Run the ePaDEL command obtaining names of descriptors and fingerprint bits.
+
+        Names only depend on the arguments, the versions of ePaDEL and of the jars it depends on,
+        and the Java runtime, so that they are obtained once and memoized in memory and on disk.
+
+        :param command: ePaDEL arguments to be run
+        :return: names of values of each block, one block per line
+        """
+        key = self._names_key(command)
+        if key in _names:
+            return _names[key]
+        path = os.path.join(get_cache_dir(), 'names', f'{key}.txt')
+        if os.path.isfile(path):
+            with open(path) as handle:
+                _names[key] = handle.read()
+            return _names[key]
+        with self._timer('names'):
+            if self.persistent:
+                names = get_server(self._command_prefix).request(command).decode()
+            else:
+                self._count('jvm_launches')
+                with Popen(self._command_prefix + command, stdout=PIPE) as process:
+                    names = process.stdout.read().decode()
+        if not len(names.strip()):
+            # Do not memoize failures
+            return names
+        _names[key] = names
+        try:
+            # Write atomically as other processes may be reading
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}'
+            with open(tmp_path, 'w') as handle:
+                handle.write(names)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        return names
+
+    def _forget_names(self, command: List[str]) -> None:
+        """Remove the names obtained by an ePaDEL command from memory and disk (see _run_names)."""
+        key = self._names_key(command)
+        _names.pop(key, None)
+        try:
+            os.remove(os.path.join(get_cache_dir(), 'names', f'{key}.txt'))
+        except OSError:
+            pass
+
+    def _names_key(self, command: List[str]) -> str:
+        """Key identifying the names obtained by an ePaDEL command."""
+        return hashlib.sha256(' '.join(command + [self._runtime_digest()]).encode()).hexdigest()
+
+    def _runtime_digest(self) -> str:
+        """Digest identifying ePaDEL, the jars it depends on and the Java runtime running it."""
+        java = self._command_prefix[0]
+        return hashlib.sha256(' '.join([jar_digest(_EPADEL_PATH), os.path.realpath(java),
+                                        java_version(java)]).encode()).hexdigest()
+
+    def _get_blocks(self, names: str) -> List[Tuple[List[str], str]]:
+        """Obtain the names and data type of values of each block (descriptors, then each fingerprint).
+
+        :param names: names of values of each block, one block per line
+        """
+        names = [block.split() for block in names.splitlines()]
+        dtypes = (['<f8'] if len(self.descriptors) else []) + ['<i4' if fp.is_count else 'u1'
+                                                              for fp in self.fingerprints]
+        return list(zip(names, dtypes))
+
+    def _get_kinds(self) -> List[str]:
+        """Obtain the kind of values of each block (i.e. 'descriptors', 'bits' or 'counts')."""
+        return (['descriptors'] if len(self.descriptors) else []) + ['counts' if fp.is_count else 'bits'
+                                                                     for fp in self.fingerprints]
+
+    def _binary_rows(self, values: bytes, blocks: List[Tuple[List[str], str]]) -> np.ndarray:
+        """Map the binary output of ePaDEL onto a structured array, without copy.
+
+        :param values: little-endian rows written by ePaDEL
+        :param blocks: names and data type of values of each block (descriptors, then each fingerprint)
+        :return: rows with fields 'block<i>' holding the values of each block and 'status<i>'
+         holding whether each fingerprint could be calculated
+        """
+        return np.frombuffer(values, dtype=self._binary_layout(blocks))
+
+    def _binary_layout(self, blocks: List[Tuple[List[str], str]]) -> np.dtype:
+        """Obtain the layout of a binary row written by ePaDEL (see _binary_rows).
+
+        :param blocks: names and data type of values of each block (descriptors, then each fingerprint)
+        """
+        fields = []
+        for i, (names, dtype) in enumerate(blocks):
+            # Only fingerprints have a status
+            if i > 0 or not len(self.descriptors):
+                fields.append((f'status{i}', 'u1'))
+            fields.append((f'block{i}', dtype, (len(names),)))
+        return np.dtype(fields)
+
+    def calculate_to_file(self, mols: Iterable[Chem.Mol], path: str, format: str = 'parquet',
+                          show_banner: bool = True, njobs: int = 1, chunksize: int = 100,
+                          dtype: np.dtype = np.float64, java_threads: int = 1) -> List[str]:
+        """Calculate PaDEL descriptors and write them to a file, one chunk of molecules at a time.
+
+        The full result is never held in memory.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param path: path of the output file
+        :param format: format of the output file; one of {'parquet', 'feather', 'npy'}.
+         'parquet' writes one row group per chunk, 'feather' writes one Arrow IPC record batch per chunk
+         and 'npy' fills a preallocated memory-mapped NumPy array (requires the number of molecules to be known).
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :param njobs: number of concurrent processes
+        :param chunksize: number of molecules of each chunk
+        :param dtype: data type of the NumPy array (ignored unless format is 'npy')
+        :param java_threads: number of threads of each ePaDEL process calculating descriptors of molecules
+         concurrently
+        :return: the names of the columns of the output file
+        """
+        if format not in ['parquet', 'feather', 'npy']:
+            raise ValueError(f'format {format} is not supported.')
+        if format == 'npy' and not hasattr(mols, '__len__'):
+            raise ValueError('the number of molecules must be known to write a NumPy array.')
+        if show_banner:
+            self._show_banner()
+        chunks = self.iter_calculate(mols, show_banner=False, njobs=njobs, chunksize=chunksize,
+                                     java_threads=java_threads)
+        return self._write_values(chunks, path, format, len(mols) if format == 'npy' else None, dtype)
+
+    def _write_values(self, chunks: Iterable[pd.DataFrame], path: str, format: str, n_rows: Optional[int],
+                      dtype: np.dtype = np.float64) -> List[str]:
+        """Write values of consecutive chunks of molecules to a file as they are calculated.
+
+        :param chunks: values of chunks, indexed by the position of molecules in the output
+        :param path: path of the output file
+        :param format: format of the output file; one of {'parquet', 'feather', 'npy'}
+        :param n_rows: number of molecules (ignored unless format is 'npy')
+        :param dtype: data type of the NumPy array (ignored unless format is 'npy')
+        :return: the names of the columns of the output file
+        """
+        # Column layout is known in advance
+        blocks = self._get_blocks(self._run_names(self._create_command()[0]))
+        columns = [name for names, _ in blocks for name in names]
+        if format == 'npy':
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_rows, len(columns)))
+            for chunk in chunks:
+                array[chunk.index[0]:chunk.index[-1] + 1] = chunk.to_numpy(dtype=float, na_value=np.nan)
+            array.flush()
+            del array
+            return columns
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow must be installed to write parquet or feather files.') from None
+        # Descriptors as float64, fingerprint bits as uint8, fingerprint counts as int32
+        arrow_types = {'<f8': pa.float64(), 'u1': pa.uint8(), '<i4': pa.int32()}
+        schema = pa.schema([(name, arrow_types[dtype]) for names, dtype in blocks for name in names])
+        if format == 'parquet':
+            writer = pq.ParquetWriter(path, schema)
+        else:
+            writer = pa.ipc.new_file(path, schema)
+        with writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        return columns
+
+    def calculate_file(self, path: str, show_banner: bool = True, njobs: int = 1, chunksize: int = 100,
+                       java_threads: int = 1, stats: Optional[SchedulingStats] = None) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of the molecules of an SD or SMILES file.
+
+        Processes are given byte ranges of the file and parse their molecules themselves.
+        Chunks of SD records in the V2000 format, with hydrogen atoms and coordinates suited to the descriptors,
+        are sent to ePaDEL as they are.
+        Molecules of SMILES files (one per line, optionally followed by a name) are given explicit hydrogen atoms.
+        Molecules that cannot be parsed or that have more than 999 atoms have empty rows.
+
+        :param path: path to the SD (.sd, .sdf or .mol) or SMILES file
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :param njobs: number of concurrent processes
+        :param chunksize: number of molecules to be processed by a process; ignored if njobs is 1
+        :param java_threads: number of threads of each ePaDEL process
+        :param stats: statistics to be updated with the busy time of each process (ignored if njobs is 1);
+         CalculationStats also collect the time spent in each stage and counters, aggregated across processes
+        :return: a pandas DataFrame containing all PaDEL descriptor values, in the order of the file
+        """
+        ranges = index_records(path)
+        # Molecules are looked up in the cache by the calling process
+        if self.cache is not None:
+            return self.calculate(read_records(path, 0, ranges[-1, 1]) if len(ranges) else [],
+                                  show_banner=show_banner, njobs=njobs, chunksize=chunksize,
+                                  java_threads=java_threads, stats=stats)
+        if njobs == 1:
+            chunksize = max(1, len(ranges))
+        chunks = [('file', (path, int(ranges[i, 0]), int(ranges[min(i + chunksize, len(ranges)) - 1, 1])))
+                  for i in range(0, len(ranges), chunksize)]
+        return self._calculate_sources(chunks, show_banner, njobs, java_threads, stats)
+
+    def calculate_smiles(self, smiles: Iterable[str], show_banner: bool = True, njobs: int = 1, chunksize: int = 100,
+                         java_threads: int = 1, stats: Optional[SchedulingStats] = None) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of molecules given as SMILES.
+
+        Processes are given chunks of SMILES and parse their molecules themselves.
+        Molecules are given explicit hydrogen atoms; those that cannot be parsed or that have more than 999 atoms
+        have empty rows.
+
+        :param smiles: SMILES strings, optionally followed by a name
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :param njobs: number of concurrent processes
+        :param chunksize: number of molecules to be processed by a process; ignored if njobs is 1
+        :param java_threads: number of threads of each ePaDEL process
+        :param stats: statistics to be updated with the busy time of each process (ignored if njobs is 1);
+         CalculationStats also collect the time spent in each stage and counters, aggregated across processes
+        :return: a pandas DataFrame containing all PaDEL descriptor values, in input order
+        """
+        # Molecules are looked up in the cache by the calling process
+        if self.cache is not None:
+            return self.calculate(parse_smiles(smiles), show_banner=show_banner, njobs=njobs, chunksize=chunksize,
+                                  java_threads=java_threads, stats=stats)
+        if njobs == 1:
+            chunks = [('smiles', list(smiles))]
+        else:
+            chunks = (('smiles', list(chunk)) for chunk in more_itertools.batched(smiles, chunksize))
+        return self._calculate_sources(chunks, show_banner, njobs, java_threads, stats)
+
+    def _calculate_sources(self, chunks: Iterable[Tuple[str, Any]], show_banner: bool, njobs: int,
+                           java_threads: int, stats: Optional[SchedulingStats]) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of chunks of molecules parsed by the processes calculating them.
+
+        :param chunks: kinds ('file' or 'smiles') and sources (byte range of a file or SMILES) of chunks
+        :param show_banner: If True, show notice on PaDEL descriptors usage
+        :param njobs: number of concurrent processes
+        :param java_threads: number of threads of each ePaDEL process
+        :param stats: statistics to be updated with the busy time of each process
+        """
+        if show_banner:
+            self._show_banner()
+        results = list(self._iter_sources(chunks, njobs, java_threads, stats))
+        if not len(results):
+            # Empty input
+            return self._calculate([], java_threads)
+        return pd.concat(results).reset_index(drop=True)
+
+    def _iter_sources(self, chunks: Iterable[Tuple[str, Any]], njobs: int, java_threads: int,
+                      stats: Optional[SchedulingStats] = None) -> Iterator[pd.DataFrame]:
+        """Lazily calculate PaDEL descriptors of chunks of molecules parsed by the processes calculating them.
+
+        :param chunks: kinds ('file' or 'smiles') and sources (byte range of a file or SMILES) of chunks
+        :param njobs: number of concurrent processes
+        :param java_threads: number of threads of each ePaDEL process
+        :param stats: statistics to be updated with the busy time of each process
+        :return: pandas DataFrames containing the PaDEL descriptor values of consecutive chunks,
+         in input order and indexed by the position of molecules in the input
+        """
+        self._stats = stats if isinstance(stats, CalculationStats) else None
+        offset = 0
+        if njobs > 1:
+            # Resolve Java once for all processes
+            self._resolve_java()
+            with BoundedProcessPoolExecutor(max_workers=njobs) as worker:
+                pending = deque()
+                for kind, source in chunks:
+                    pending.append(worker.submit(self._timed_source_calculate, kind, source, java_threads,
+                                                 self._stats is not None))
+                    # Wait for the oldest chunk should too many be in flight
+                    if len(pending) >= 2 * njobs:
+                        result = self._set_offset(self._collect(pending.popleft(), stats), offset)
+                        offset += len(result)
+                        yield result
+                while len(pending):
+                    result = self._set_offset(self._collect(pending.popleft(), stats), offset)
+                    offset += len(result)
+                    yield result
+        else:
+            for kind, source in chunks:
+                result = self._set_offset(copy(self)._source_calculate(kind, source, java_threads), offset)
+                offset += len(result)
+                yield result
+
+    def _timed_source_calculate(self, kind: str, source: Any, java_threads: int = 1, collect_stats: bool = False
+                                ) -> Tuple[int, float, pd.DataFrame, Optional[CalculationStats]]:
+        """Calculate PaDEL descriptors of a chunk parsed by the current process and measure the time it took.
+
+        :param kind: kind of the source of molecules; one of {'file', 'smiles'}
+        :param source: path, start and end offsets of records of a file, or SMILES strings
+        :param java_threads: number of threads of ePaDEL
+        :param collect_stats: If True, collect statistics of the stages of the calculation
+        :return: the identifier of the process, its busy time in seconds, the calculated values
+         and the statistics of the calculation (None unless collected)
+        """
+        stats = CalculationStats() if collect_stats else None
+        start = time.perf_counter()
+        # The instance was unpickled by this process: copying is enough
+        padel = copy(self)
+        padel._stats = stats
+        result = padel._source_calculate(kind, source, java_threads)
+        return os.getpid(), time.perf_counter() - start, result, stats
+
+    def _source_calculate(self, kind: str, source: Any, java_threads: int = 1) -> pd.DataFrame:
+        """Parse molecules of a chunk and calculate their PaDEL descriptors.
+
+        :param kind: kind of the source of molecules; one of {'file', 'smiles'}
+        :param source: path, start and end offsets of records of a file, or SMILES strings
+        :param java_threads: number of threads of ePaDEL
+        """
+        records = None
+        with self._timer('reading'):
+            if kind == 'smiles':
+                mols = parse_smiles(source)
+            else:
+                path, start, end = source
+                data = read_range(path, start, end)
+                mols = parse_records(data, is_sd_file(path))
+                records = data if is_sd_file(path) else None
+        # ePaDEL cannot process molecules with more than 999 atoms
+        mols = [mol if mol is None or mol.GetNumAtoms() <= 999 else None for mol in mols]
+        # Send SD records as they are, should they not need to be prepared
+        if records is not None and self._is_prepared(mols, records):
+            commands = self._prepare_records(mols, records)
+        else:
+            commands = self._prepare_command(mols)
+        if java_threads > 1:
+            commands = commands[0], commands[1] + ['--threads', str(java_threads)]
+        try:
+            return self._run_command(commands)
+        finally:
+            self._cleanup()
+
+    def _is_prepared(self, mols: List[Optional[Chem.Mol]], records: bytes) -> bool:
+        """Whether SD records can be processed by ePaDEL without being checked and serialized again.
+
+        :param mols: molecules parsed from the records
+        :param records: content of the SD records
+        """
+        if self.stream_input or b'V3000' in records or not all(isinstance(mol, Chem.Mol) for mol in mols):
+            return False
+        if missing_hydrogens(mols).any():
+            return False
+        return all(mol.GetNumAtoms() <= 999 and mol.GetNumConformers() > 0 and
+                   (self._is_3D(mol) or not self.has_3D_descriptors)
+                   for mol in mols)
 
+    def _prepare_records(self, mols: List[Chem.Mol], records: bytes) -> Tuple[List[str], List[str]]:
+        """Create the ePaDEL arguments to be run on SD records written as they are to a temporary file.
 
-    def _calculate(self, mols: List[Chem.Mol]) -> pd.DataFrame:
+        :param mols: molecules parsed from the records, kept should ePaDEL need to be restarted
+        :param records: content of the SD records
+        :return: The arguments of the commands to run (names and values).
+        """
+        self._skipped = []
+        self._count('molecules', len(mols))
+        self._molecules = mols
+        self._tmp_sd = mktempfile('molecules_v2k.sd')
+        with self._timer('serialization'), open(self._tmp_sd, 'wb') as handle:
+            handle.write(records)
+        self._count('bytes_sent', len(records))
+        return self._create_command()
+
+    def _calculate(self, mols: List[Chem.Mol], java_threads: int = 1) -> pd.DataFrame:
         """Calculate PaDEL descriptors on one process.
 
         :param mols: RDkit molecules for which PaDEL descriptors should be calculated.
          Only the last conformer of molecules is considered.
+        :param java_threads: number of threads of ePaDEL
         :return: a pandas DataFrame containing all PaDEL desciptor values and the path to the temp dir to be removed
         """
-        results = []
         # Prepare inputs
-        desc_commands, fp_commands = self._prepare_command(mols)
-        # If descriptors to be calculated
-        if len(desc_commands):
-            desc_values = self._run_command(desc_commands[0])
-            # Keep only specified descriptors
-            selected_features = desc_values.columns[~desc_values.columns.isin(self.desc_kept)]
-            desc_values.drop(columns=selected_features, inplace=True)
-            results.append(desc_values)
-        # If FPs to be calculated
-        for fp_command in fp_commands:
-            fp_values = self._run_command(fp_command)
-            results.append(fp_values)
+        commands = self._prepare_command(mols)
+        if java_threads > 1:
+            commands = commands[0], commands[1] + ['--threads', str(java_threads)]
+        # Obtain descriptors and FPs, with empty rows for skipped molecules
+        results = self._run_command(commands)
         # Cleanup
         self._cleanup()
-        results = pd.concat(results, axis=1)
-        # Insert lines of skipped molecules
-        if len(self._skipped):
-            results = pd.DataFrame(np.insert(results.values, self._skipped,
-                                             values=[np.nan] * len(results.columns),
-                                             axis=0),
-                                   columns=results.columns)
         return results
 
 
-    def _multiproc_calculate(self, mols: List[Chem.Mol]) -> pd.DataFrame:
+    def _multiproc_calculate(self, mols: List[Chem.Mol], java_threads: int = 1,
+                             stats: Optional[CalculationStats] = None) -> pd.DataFrame:
         """Calculate PaDEL descriptors in thread-safe manner.
 
         :param mols: RDkit molecules for which PaDEL descriptors should be calculated.
          Only the last conformer of molecules is considered.
+        :param java_threads: number of threads of ePaDEL
+        :param stats: statistics of the calculation to be updated
         :return: a pandas DataFrame containing all PaDEL desciptor values and the path to the temp dir to be removed
         """
         # Copy self instance to make thread safe
         padel = deepcopy(self)
+        padel.cache = None
         # Run copy
-        result = padel.calculate(mols, show_banner=False, njobs=1)
+        result = padel.calculate(mols, show_banner=False, njobs=1, java_threads=java_threads, stats=stats)
         return result
 
+    def _timed_calculate(self, mols: List[Chem.Mol], java_threads: int = 1, collect_stats: bool = False
+                         ) -> Tuple[int, float, pd.DataFrame, Optional[CalculationStats]]:
+        """Calculate PaDEL descriptors in thread-safe manner and measure the time it took.
+
+        :param mols: RDkit molecules for which PaDEL descriptors should be calculated.
+        :param java_threads: number of threads of ePaDEL
+        :param collect_stats: If True, collect statistics of the stages of the calculation
+        :return: the identifier of the process, its busy time in seconds, the calculated values
+         and the statistics of the calculation (None unless collected)
+        """
+        stats = CalculationStats() if collect_stats else None
+        start = time.perf_counter()
+        result = self._multiproc_calculate(mols, java_threads, stats)
+        return os.getpid(), time.perf_counter() - start, result, stats
+
+
+    def _calculate_compact(self, mols: Iterable[Chem.Mol], fingerprint_format: str, njobs: int, chunksize: int,
+                           java_threads: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Calculate PaDEL descriptors and keep fingerprints packed or sparse.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param fingerprint_format: format of fingerprints; one of {'packed', 'sparse'}
+        :param njobs: number of concurrent processes
+        :param chunksize: number of molecules to be processed by a process; ignored if njobs is 1
+        :param java_threads: number of threads of each ePaDEL process
+        """
+        try:
+            from scipy import sparse
+        except ImportError:
+            raise ImportError('scipy must be installed to obtain packed or sparse fingerprints.') from None
+        if njobs > 1:
+            # Resolve Java once for all processes
+            self._resolve_java()
+            with BoundedProcessPoolExecutor(max_workers=njobs) as worker:
+                futures = [worker.submit(self._compact_calculate, list(chunk), fingerprint_format, java_threads)
+                           for chunk in more_itertools.batched(mols, chunksize)]
+                results = [future.result() for future in futures]
+        else:
+            results = []
+        # Single process, or no molecule
+        if not len(results):
+            results = [self._compact_calculate(list(mols), fingerprint_format, java_threads)]
+        descriptors = pd.concat([values for values, _ in results]).reset_index(drop=True)
+        fingerprints = {}
+        for name in results[0][1]:
+            chunks = [fps[name] for _, fps in results]
+            fingerprints[name] = (sparse.vstack(chunks, format='csr') if sparse.issparse(chunks[0])
+                                  else np.concatenate(chunks))
+        return descriptors, fingerprints
+
+    def _compact_calculate(self, mols: List[Chem.Mol], fingerprint_format: str,
+                           java_threads: int = 1) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Calculate PaDEL descriptors of a chunk and pack fingerprints straight from the binary output of ePaDEL.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param fingerprint_format: format of fingerprints; one of {'packed', 'sparse'}
+        :param java_threads: number of threads of ePaDEL
+        """
+        from scipy import sparse
+
+        # Copy self instance to make thread safe
+        padel = copy(self)
+        padel.output_format = 'binary'
+        commands = padel._prepare_command(mols)
+        if java_threads > 1:
+            commands = commands[0], commands[1] + ['--threads', str(java_threads)]
+        try:
+            names = padel._run_names(commands[0])
+            values = padel._run_values(commands[1])
+        finally:
+            padel._cleanup()
+        blocks = padel._get_blocks(names)
+        rows = padel._binary_rows(values, blocks)
+        descriptors = ResultAssembler(len(mols), padel._skipped)
+        fingerprints = {}
+        for i, (block_names, dtype) in enumerate(blocks):
+            if f'status{i}' not in rows.dtype.names:
+                descriptors.add(block_names, rows[f'block{i}'], padel.dtypes.get('descriptors'))
+                continue
+            fp = padel.fingerprints[i - (1 if len(padel.descriptors) else 0)]
+            # Fingerprints that could not be calculated or molecules that were skipped are left empty
+            block_values = np.zeros((len(mols), len(block_names)), dtype=dtype)
+            block_values[descriptors.kept] = rows[f'block{i}'] * (rows[f'status{i}'] == 1)[:, None].astype(dtype)
+            # Data types only depend on the kind of fingerprint, so that chunks can be stacked
+            if fp.is_count:
+                fingerprints[fp.bit_prefix] = sparse.csr_matrix(block_values, dtype=np.int32)
+            elif fingerprint_format == 'sparse':
+                fingerprints[fp.bit_prefix] = sparse.csr_matrix(block_values, dtype=bool)
+            else:
+                fingerprints[fp.bit_prefix] = np.packbits(block_values, axis=1)
+        return descriptors.to_frame(), fingerprints
+
+    def _calculate_cached(self, mols: List[Chem.Mol], **kwargs) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of molecules missing from the cache and merge them with cached values.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param kwargs: parameters of the calculation (see `calculate`)
+        """
+        config = self._configuration_key()
+        keys = [molecule_key(mol, self.has_3D_descriptors) if isinstance(mol, Chem.Mol) else None
+                for mol in mols]
+        found = self.cache.get(config, [key for key in keys if key is not None])
+        # Calculate values of molecules missing from the cache, once per structure
+        missing = {}
+        for key, mol in zip(keys, mols):
+            if key is not None and key not in found and key not in missing:
+                missing[key] = mol
+        columns = self.cache.get_columns(config)
+        if len(missing):
+            padel = copy(self)
+            padel.cache = None
+            values = padel.calculate(list(missing.values()), show_banner=False, **kwargs)
+            columns = values.columns.tolist()
+            computed = dict(zip(missing.keys(), values.to_numpy(dtype=float, na_value=np.nan)))
+            # Do not cache failures (e.g. JVM crashes or timeouts), which may not happen again
+            self.cache.put(config, columns, {key: row for key, row in computed.items() if not np.isnan(row).all()})
+            found.update(computed)
+        elif columns is None:
+            # Nothing cached nor calculated for this configuration (e.g. no valid molecule)
+            columns = [name for names, _ in self._get_blocks(self._run_names(self._create_command()[0]))
+                       for name in names]
+        # Merge values in input order
+        result = np.full((len(mols), len(columns)), np.nan)
+        for i, key in enumerate(keys):
+            if key is not None:
+                result[i] = found[key]
+        return pd.DataFrame(result, columns=columns)
+
+    def _calculate_deduplicated(self, mols: List[Chem.Mol], **kwargs) -> pd.DataFrame:
+        """Calculate PaDEL descriptors of unique molecules and scatter them back to their original positions.
+
+        :param mols: RDKit molecules for which PaDEL descriptors should be calculated
+        :param kwargs: parameters of the calculation (see `calculate`)
+        """
+        unique = {}
+        positions = []
+        for mol in mols:
+            # Invalid molecules all share the same empty line
+            key = molecule_key(mol, self.has_3D_descriptors) if isinstance(mol, Chem.Mol) else None
+            if key not in unique:
+                unique[key] = (len(unique), mol)
+            positions.append(unique[key][0])
+        values = self.calculate([mol for _, mol in unique.values()], show_banner=False, **kwargs)
+        return values.iloc[positions].reset_index(drop=True)
+
+    def _configuration_key(self) -> str:
+        """Key identifying the descriptors, fingerprints, their parameters, ePaDEL and the Java runtime."""
+        _, command = self._create_command()
+        command = [arg for arg in command if arg != '--binary']
+        # Values differ should hydrogen atoms be added
+        if self.add_hs:
+            command.append('add_hs')
+        # Values differ with the geometries of molecules lacking conformers
+        if self.conformers is not None and self.has_3D_descriptors:
+            command.append(self.conformers.key)
+        return hashlib.sha256(' '.join(command + [self._runtime_digest()]).encode()).hexdigest()
 
     @property
     def details(self):
@@ -0,0 +1,95 @@
+# -*- coding: utf-8
+
+"""Cost-aware scheduling of molecules across worker processes."""
+
+import heapq
+from typing import Dict, List, Union
+
+import numpy as np
+from rdkit import Chem
+
+from .descriptor import Descriptor, Fingerprint
+
+# Descriptors whose cost grows with the square of the number of atoms (matrices, paths and walks)
+QUADRATIC_DESCRIPTORS = ['Autocorrelation', 'BaryszMatrix', 'BCUT', 'BurdenModifiedEigenvalues', 'ChiChain',
+                         'ChiCluster', 'ChiPathCluster', 'ChiPath', 'EccentricConnectivityIndex',
+                         'InformationContent', 'MDE', 'PathCount', 'TopologicalDistanceMatrix', 'WalkCount',
+                         'WeightedPath', 'WienerNumbers', 'Autocorrelation3D', 'CPSA', 'RDF']
+# Descriptors whose cost grows steeply with the number of rings
+RING_DESCRIPTORS = ['DetourMatrix']
+
+
+def estimate_cost(mol: Chem.Mol, descriptors: List[Union[Descriptor, Fingerprint]]) -> float:
+    """Estimate the relative cost of calculating descriptors of a molecule.
+
+    :param mol: RDKit molecule
+    :param descriptors: descriptors and fingerprints to be calculated
+    :return: an arbitrary cost, only meant to be compared to that of other molecules
+    """
+    if not isinstance(mol, Chem.Mol):
+        return 0.0
+    # Hydrogen atoms are processed by ePaDEL as well
+    n_atoms = mol.GetNumAtoms(onlyExplicit=False)
+    n_rings = mol.GetRingInfo().NumRings()
+    cost = float(n_atoms)
+    for descriptor in descriptors:
+        if descriptor.name in QUADRATIC_DESCRIPTORS:
+            cost += n_atoms ** 2 / 10
+        elif descriptor.name in RING_DESCRIPTORS:
+            cost += n_atoms ** 2 / 10 * 2 ** min(n_rings, 16)
+        else:
+            cost += n_atoms
+    return cost
+
+
+def balanced_chunks(costs: List[float], n_chunks: int) -> List[List[int]]:
+    """Distribute molecules into chunks of similar total cost (longest processing time first).
+
+    :param costs: estimated cost of each molecule
+    :param n_chunks: number of chunks to create
+    :return: the sorted indices of the molecules of each non-empty chunk
+    """
+    n_chunks = max(1, min(n_chunks, len(costs)))
+    chunks = [[] for _ in range(n_chunks)]
+    # Least loaded chunk first
+    loads = [(0.0, i) for i in range(n_chunks)]
+    for index in np.argsort(costs, kind='stable')[::-1]:
+        load, i = heapq.heappop(loads)
+        chunks[i].append(int(index))
+        heapq.heappush(loads, (load + costs[index], i))
+    return [sorted(chunk) for chunk in chunks if len(chunk)]
+
+
+class SchedulingStats:
+    """Busy time of each worker process."""
+
+    def __init__(self) -> None:
+        """Instantiate empty statistics."""
+        self.busy_time: Dict[int, float] = {}
+        self.chunks: Dict[int, int] = {}
+        self.molecules: Dict[int, int] = {}
+
+    def record(self, worker: int, busy_time: float, n_molecules: int) -> None:
+        """Record the processing of a chunk.
+
+        :param worker: identifier of the worker process
+        :param busy_time: time in seconds spent calculating the chunk
+        :param n_molecules: number of molecules of the chunk
+        """
+        self.busy_time[worker] = self.busy_time.get(worker, 0.0) + busy_time
+        self.chunks[worker] = self.chunks.get(worker, 0) + 1
+        self.molecules[worker] = self.molecules.get(worker, 0) + n_molecules
+
+    @property
+    def imbalance(self) -> float:
+        """Ratio of the maximum to the mean busy time of workers (1.0 when perfectly balanced)."""
+        if not len(self.busy_time) or not sum(self.busy_time.values()):
+            return 1.0
+        times = list(self.busy_time.values())
+        return max(times) / (sum(times) / len(times))
+
+    def __repr__(self) -> str:
+        """Summarize statistics."""
+        return (f'SchedulingStats(workers={len(self.busy_time)}, chunks={sum(self.chunks.values())}, '
+                f'busy_time={ {worker: round(time, 3) for worker, time in self.busy_time.items()} }, '
+                f'imbalance={self.imbalance:.2f})')
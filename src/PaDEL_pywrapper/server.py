@@ -0,0 +1,102 @@
+# -*- coding: utf-8
+
+"""Persistent ePaDEL worker processes."""
+
+import atexit
+import os
+import threading
+from subprocess import PIPE, Popen
+from typing import Dict, List, Tuple
+
+
+class EPaDELServer:
+    """Long-lived ePaDEL process answering requests over its stdin and stdout.
+
+    Keeping the JVM alive avoids paying for its startup and the loading of CDK at each call.
+    """
+
+    END_OF_REQUEST = b'<<END>>\n'
+    QUIT = b'<<QUIT>>\n'
+
+    def __init__(self, command_prefix: List[str]) -> None:
+        """Start an ePaDEL server.
+
+        :param command_prefix: command starting ePaDEL (i.e. java executable, JVM options and path to ePaDEL.jar)
+        """
+        self._process = Popen(command_prefix + ['--server'], stdin=PIPE, stdout=PIPE)
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        """Is the underlying ePaDEL process still running."""
+        return self._process.poll() is None
+
+    def request(self, args: List[str], molecules: bytes = b'') -> bytes:
+        """Send a request to the ePaDEL server and wait for its response.
+
+        :param args: ePaDEL arguments of the request (e.g. ['-f', 'PubchemFP'])
+        :param molecules: content of the V2000 SD file to be processed (ignored for --names requests)
+        :return: the raw output of ePaDEL
+        """
+        with self._lock:
+            if not self.alive:
+                raise RuntimeError('The ePaDEL server is not running.')
+            stdin, stdout = self._process.stdin, self._process.stdout
+            stdin.write(' '.join(args).encode() + b'\n')
+            if len(molecules):
+                stdin.write(molecules if molecules.endswith(b'\n') else molecules + b'\n')
+            stdin.write(self.END_OF_REQUEST)
+            stdin.flush()
+            # Obtain the status and size of the response
+            header = stdout.readline().decode().split()
+            if len(header) != 2:
+                raise RuntimeError('The ePaDEL server stopped unexpectedly.')
+            status, size = header[0], int(header[1])
+            payload = stdout.read(size)
+        if status != 'OK':
+            raise RuntimeError(f'ePaDEL failed: {payload.decode()}')
+        return payload
+
+    def close(self) -> None:
+        """Stop the ePaDEL server."""
+        with self._lock:
+            if self.alive:
+                try:
+                    self._process.stdin.write(self.QUIT)
+                    self._process.stdin.close()
+                    self._process.wait(timeout=10)
+                except (OSError, ValueError):
+                    pass
+            if self.alive:
+                self._process.kill()
+            self._process.wait()
+            self._process.stdout.close()
+
+
+# Servers of the current process
+_servers: Dict[Tuple[int, Tuple[str, ...]], EPaDELServer] = {}
+_servers_lock = threading.Lock()
+
+
+def get_server(command_prefix: List[str]) -> EPaDELServer:
+    """Obtain the ePaDEL server of the current process, starting it if need be.
+
+    :param command_prefix: command starting ePaDEL (i.e. java executable, JVM options and path to ePaDEL.jar)
+    """
+    # Servers are not shared with forked processes
+    key = (os.getpid(), tuple(command_prefix))
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is None or not server.alive:
+            server = _servers[key] = EPaDELServer(command_prefix)
+    return server
+
+
+@atexit.register
+def shutdown_servers() -> None:
+    """Stop all ePaDEL servers started by the current process."""
+    with _servers_lock:
+        for (pid, _), server in list(_servers.items()):
+            if pid == os.getpid():
+                server.close()
+        _servers.clear()
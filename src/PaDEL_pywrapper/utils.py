@@ -2,18 +2,29 @@
 
 """Utility functions."""
 
+import io
 import sys
 import os
 import glob
+import json
+import hashlib
+import functools
+import subprocess
 import tempfile
 import shutil
+import zipfile
 from pathlib import Path
-from typing import Union, Tuple
+from typing import Dict, Iterable, List, Optional, Union, Tuple
 
 import numpy as np
 from rdkit import Chem
 from jdk import install as _jre_install, _JRE_DIR
 
+# Path to the Java executable of each version, resolved once per process
+_java_paths: Dict[int, str] = {}
+# Extensions of SD files, other files being read as SMILES files (one molecule per line, optionally followed by names)
+SD_EXTENSIONS = ('.sd', '.sdf', '.mol')
+
 
 def parse_numeric(value: str) -> Union[int, float]:
     """Parse a string representation of a number."""
@@ -68,15 +79,98 @@ def get_jre_in_dir(dir: str, version: int = 11):
 
 
 def install_java(version: int = 11):
-    """Install a Java Runtime Environment."""
-    path = get_java_in_dir(_JRE_DIR, version)
+    """Install a Java Runtime Environment and return the path to its Java executable.
+
+    The executable is resolved once per process. It is either set by the PADEL_PYWRAPPER_JAVA environment variable
+    (path to a Java executable or to a Java home, e.g. $JAVA_HOME) or searched for in the installation directory of
+    the JRE, the result being recorded on disk for other processes.
+
+    :param version: major version of the JRE
+    """
+    if version in _java_paths:
+        return _java_paths[version]
+    path = get_java_override()
+    if path is None:
+        path = _read_java_record(version)
     if path is None:
-        # Could not find JRE, install it
-        _ = _jre_install(version, jre=True)
         path = get_java_in_dir(_JRE_DIR, version)
+        if path is None:
+            # Could not find JRE, install it
+            _ = _jre_install(version, jre=True)
+            path = get_java_in_dir(_JRE_DIR, version)
+        if path is None:
+            return None
+        _write_java_record(version, path)
+    _java_paths[version] = path
     return path
 
 
+def warm_up_java(path: Optional[str] = None, version: int = 11) -> str:
+    """Resolve (installing it if needed) and verify the Java executable, e.g. before starting worker processes.
+
+    :param path: path to a Java executable or to a Java home to be used instead of the one resolved by install_java
+    :param version: major version of the JRE
+    :return: the path to the Java executable
+    """
+    java = get_java_executable(path) if path is not None else install_java(version)
+    if java is None:
+        raise RuntimeError('Java could not be installed.')
+    process = subprocess.run([java, '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f'Java executable {java} cannot be run: {process.stderr.decode(errors="replace")}')
+    return java
+
+
+def get_java_override() -> Optional[str]:
+    """Return the path to the Java executable set by the PADEL_PYWRAPPER_JAVA environment variable, if any."""
+    path = os.environ.get('PADEL_PYWRAPPER_JAVA')
+    if not path:
+        return None
+    return get_java_executable(path)
+
+
+def get_java_executable(path: str) -> str:
+    """Return the path to a Java executable, or to the Java executable of a Java home."""
+    # Java home
+    if os.path.isdir(path):
+        path = os.path.join(path, 'bin', 'java.exe' if sys.platform == "win32" else 'java')
+    if not os.path.isfile(path):
+        raise ValueError(f'Java executable {path} does not exist.')
+    return os.path.abspath(path)
+
+
+def _read_java_record(version: int) -> Optional[str]:
+    """Return the path to the Java executable recorded on disk, should it not have been modified since."""
+    try:
+        with open(os.path.join(get_cache_dir(), 'java.json')) as handle:
+            record = json.load(handle)[str(version)]
+        if record['root'] == _JRE_DIR and os.path.getmtime(record['path']) == record['mtime']:
+            return record['path']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_java_record(version: int, path: str) -> None:
+    """Record the path to the Java executable on disk along with its modification time."""
+    record_path = os.path.join(get_cache_dir(), 'java.json')
+    try:
+        try:
+            with open(record_path) as handle:
+                records = json.load(handle)
+        except (OSError, ValueError):
+            records = {}
+        records[str(version)] = {'root': _JRE_DIR, 'path': path, 'mtime': os.path.getmtime(path)}
+        # Write atomically as other processes may be reading
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+        tmp_path = f'{record_path}.{os.getpid()}'
+        with open(tmp_path, 'w') as handle:
+            json.dump(records, handle)
+        os.replace(tmp_path, record_path)
+    except OSError:
+        pass
+
+
 def get_java_in_dir(dir: str, version: int):
     """Recursively search the directory to find a JRE."""
     paths = glob.glob(os.path.join(dir, '**', 'bin',
@@ -88,6 +182,15 @@ def get_java_in_dir(dir: str, version: int):
     return None
 
 
+def get_cache_dir() -> str:
+    """Return the path to the directory holding data cached across sessions.
+
+    Defaults to ~/.cache/PaDEL_pywrapper unless the PADEL_PYWRAPPER_CACHE environment variable is set.
+    """
+    return os.environ.get('PADEL_PYWRAPPER_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'PaDEL_pywrapper'))
+
+
 def mktempdir(suffix: str = None) -> str:
     """Return the path to a writeable temporary directory."""
     dir = tempfile.mkdtemp(suffix=suffix)
@@ -107,12 +210,155 @@ def needsHs(mol: Chem.Mol) -> bool:
     :param mol: RDKit Molecule
     :return: True if the molecule lacks hydrogens.
     """
-    for atom in mol.GetAtoms():
-        nHNbrs = 0
-        for nbr in atom.GetNeighbors():
-            if nbr.GetAtomicNum() == 1:
-                nHNbrs += 1
-        noNeighbors = False
-        if atom.GetTotalNumHs(noNeighbors) > nHNbrs:
-            return True
-    return False
+    return missing_hydrogens([mol])[0] > 0
+
+
+def missing_hydrogens(mols: List[Chem.Mol]) -> np.ndarray:
+    """Return the number of hydrogen atoms each molecule lacks.
+
+    Hydrogen atoms that are implicit or attached as atom properties (i.e. not present as atoms) are missing.
+
+    :param mols: RDKit Molecules (invalid molecules lack none)
+    :return: the number of missing hydrogen atoms of each molecule
+    """
+    # Counts including implicit hydrogens minus counts of actual atoms
+    return np.array([mol.GetNumAtoms(onlyExplicit=False) - mol.GetNumAtoms() if isinstance(mol, Chem.Mol) else 0
+                     for mol in mols], dtype=int)
+
+
+def molecule_key(mol: Chem.Mol, with_coordinates: bool = False) -> str:
+    """Return a canonical key identifying the structure of a molecule.
+
+    Explicit hydrogen atoms are part of the key, as they affect the values of descriptors.
+
+    :param mol: RDKit Molecule
+    :param with_coordinates: include the coordinates of the last conformer in the key (e.g. for 3D descriptors)
+    :return: canonical SMILES of the molecule, followed by the digest of its coordinates if required
+    """
+    key = Chem.MolToSmiles(mol)
+    if with_coordinates and mol.GetNumConformers():
+        # Coordinates in canonical atom order
+        order = np.argsort(list(Chem.CanonicalRankAtoms(mol, breakTies=True)))
+        coordinates = np.round(mol.GetConformers()[-1].GetPositions()[order], 4) + 0.0
+        key += ' ' + hashlib.sha1(coordinates.tobytes()).hexdigest()
+    return key
+
+
+@functools.lru_cache(maxsize=None)
+def file_digest(path: str) -> str:
+    """Return the SHA-256 digest of a file."""
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def jar_digest(path: str) -> str:
+    """Return the SHA-256 digest of a jar and of the jars on the Class-Path of its manifest."""
+    digests = [file_digest(path)]
+    with zipfile.ZipFile(path) as jar:
+        manifest = jar.read('META-INF/MANIFEST.MF').decode()
+    # Lines of the manifest are continued by lines starting with a space
+    manifest = manifest.replace('\r\n', '\n').replace('\n ', '')
+    for line in manifest.splitlines():
+        if line.startswith('Class-Path:'):
+            for name in line.split(':', 1)[1].split():
+                dependency = os.path.join(os.path.dirname(path), name)
+                digests.append(f'{name}:{file_digest(dependency) if os.path.isfile(dependency) else None}')
+    return hashlib.sha256(' '.join(digests).encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def java_version(path: str) -> str:
+    """Return the version of a Java executable, as described by the release file of its Java home if any."""
+    release = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(path))), 'release')
+    if os.path.isfile(release):
+        with open(release) as handle:
+            return handle.read()
+    process = subprocess.run([path, '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return process.stderr.decode(errors='replace')
+
+
+def is_sd_file(path: str) -> bool:
+    """Whether a file of molecules is an SD file, based on its extension."""
+    return os.path.splitext(path)[1].lower() in SD_EXTENSIONS
+
+
+def index_records(path: str) -> np.ndarray:
+    """Obtain the byte ranges of the records of an SD or SMILES file.
+
+    :param path: path to the SD or SMILES file
+    :return: the start and end offsets of each record
+    """
+    is_sd = is_sd_file(path)
+    ranges = []
+    position = start = 0
+    with open(path, 'rb') as handle:
+        for line in handle:
+            position += len(line)
+            if is_sd:
+                # Records end with $$$$
+                if line.rstrip(b'\r\n') == b'$$$$':
+                    ranges.append((start, position))
+                    start = position
+            else:
+                # Blank lines are not records
+                if line.strip():
+                    ranges.append((start, position))
+                start = position
+    # Last SD record without a terminating line
+    if is_sd and start < position:
+        with open(path, 'rb') as handle:
+            handle.seek(start)
+            if handle.read().strip():
+                ranges.append((start, position))
+    return np.array(ranges, dtype=np.int64).reshape(-1, 2)
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    """Read a byte range of a file.
+
+    :param path: path to the file
+    :param start: offset of the first byte
+    :param end: offset following the last byte
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        return handle.read(end - start)
+
+
+def parse_records(data: bytes, is_sd: bool) -> List[Optional[Chem.Mol]]:
+    """Parse consecutive records of an SD or SMILES file.
+
+    Molecules of SMILES files are given explicit hydrogen atoms. Molecules that cannot be parsed are None.
+
+    :param data: content of the records
+    :param is_sd: whether records are SD records or lines of a SMILES file
+    """
+    if is_sd:
+        return list(Chem.ForwardSDMolSupplier(io.BytesIO(data), removeHs=False))
+    return parse_smiles(line for line in data.decode().splitlines() if line.strip())
+
+
+def parse_smiles(smiles: Iterable[str]) -> List[Optional[Chem.Mol]]:
+    """Parse SMILES, optionally followed by names, and give molecules explicit hydrogen atoms.
+
+    :param smiles: SMILES strings
+    :return: the molecules, None for SMILES that cannot be parsed
+    """
+    mols = []
+    for line in smiles:
+        mol = Chem.MolFromSmiles(line.split()[0]) if line.strip() else None
+        mols.append(Chem.AddHs(mol) if mol is not None else None)
+    return mols
+
+
+def read_records(path: str, start: int, end: int) -> List[Optional[Chem.Mol]]:
+    """Read the molecules of a byte range of an SD or SMILES file.
+
+    Molecules of SMILES files are given explicit hydrogen atoms. Molecules that cannot be parsed are None.
+
+    :param path: path to the SD or SMILES file
+    :param start: offset of the first record
+    :param end: offset of the end of the last record
+    """
+    return parse_records(read_range(path, start, end), is_sd_file(path))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Test double of the Java executable, hanging or crashing on molecules named HANG or CRASH.
+
+Run as `python java_double.py <java> [arguments...]`: values of the molecules preceding the first one named
+HANG or CRASH are calculated by ePaDEL with the actual Java executable, after which the double hangs or exits
+with a non-zero status. Other commands are run by the actual Java executable unchanged.
+"""
+
+import os
+import stat
+import subprocess
+import sys
+import time
+
+FAILURES = (b'HANG', b'CRASH')
+
+
+def create_java_double(directory: str, java: str) -> str:
+    """Create an executable wrapping the actual Java executable with the double.
+
+    :param directory: directory the executable is created in
+    :param java: path to the actual Java executable
+    :return: the path to the executable, to be set as PADEL_PYWRAPPER_JAVA
+    """
+    path = os.path.join(directory, 'java')
+    with open(path, 'w') as handle:
+        handle.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "{java}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def main(java: str, args: list) -> int:
+    """Run the double."""
+    if '-i' not in args:
+        os.execv(java, [java] + args)
+    position = args.index('-i') + 1
+    if args[position] == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args[position], 'rb') as handle:
+            data = handle.read()
+    records = [record + b'$$$$\n' for record in data.split(b'$$$$\n') if len(record.strip())]
+    failure = None
+    for i, record in enumerate(records):
+        # The first line of a record is the name of its molecule
+        name = record.split(b'\n', 1)[0].strip()
+        if name in FAILURES:
+            failure, records = name, records[:i]
+            break
+    # Calculate values of the preceding molecules
+    if len(records) or failure is None:
+        process = subprocess.run([java] + args[:position] + ['-'] + args[position + 1:], input=b''.join(records),
+                                 stdout=subprocess.PIPE)
+        sys.stdout.buffer.write(process.stdout)
+        sys.stdout.buffer.flush()
+        if failure is None:
+            return process.returncode
+    if failure == b'HANG':
+        time.sleep(3600)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Tests for resumable, sharded calculations."""
+
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import unittest
+
+from rdkit import Chem
+
+from PaDEL_pywrapper import PaDEL
+from PaDEL_pywrapper.batch import ShardedRun, main
+from PaDEL_pywrapper.descriptor import AtomCount, TPSA, Weight
+from PaDEL_pywrapper.utils import index_records, mktempdir, read_records
+from tests.constants import MOLECULES
+
+
+class TestBatch(unittest.TestCase):
+    """Tests for PaDEL_pywrapper sharded runs."""
+    def setUp(self) -> None:
+        """Write molecules to SMILES and SD files."""
+        self.dir = mktempdir()
+        self.molecules = list(MOLECULES.values())
+        self.smiles = os.path.join(self.dir, 'molecules.smi')
+        with open(self.smiles, 'w') as handle:
+            for name, mol in MOLECULES.items():
+                handle.write(f'{Chem.MolToSmiles(mol)} {name}\n')
+            # Unparsable molecule and blank line
+            handle.write('C1CC invalid\n\n')
+        self.sd = os.path.join(self.dir, 'molecules.sdf')
+        with Chem.SDWriter(self.sd) as writer:
+            for mol in self.molecules:
+                writer.write(Chem.AddHs(mol))
+        self.padel = PaDEL([Weight, AtomCount, TPSA])
+
+    def tearDown(self) -> None:
+        """Remove files."""
+        shutil.rmtree(self.dir)
+
+    def test_read_records(self):
+        """Test records of SMILES and SD files are indexed and read by byte range."""
+        for path in [self.smiles, self.sd]:
+            ranges = index_records(path)
+            self.assertEqual(len(ranges), len(self.molecules) + (path == self.smiles))
+            mols = read_records(path, ranges[1, 0], ranges[3, 1])
+            self.assertEqual([Chem.MolToSmiles(mol, isomericSmiles=False) for mol in mols],
+                             [Chem.MolToSmiles(Chem.AddHs(mol), isomericSmiles=False)
+                              for mol in self.molecules[1:4]])
+        self.assertIsNone(read_records(self.smiles, *index_records(self.smiles)[-1])[0])
+
+    def test_sharded_run(self):
+        """Test shards are written once and runs are resumed."""
+        output_dir = os.path.join(self.dir, 'output')
+        expected = self.padel.calculate(read_records(self.smiles, 0, os.path.getsize(self.smiles)),
+                                        show_banner=False)
+        # Parquet files are written with pyarrow
+        for format in ['parquet', 'npy'] if importlib.util.find_spec('pyarrow') is not None else ['npy']:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            run = ShardedRun(self.smiles, output_dir, shard_size=3, format=format)
+            # Molecules of shards are parsed by worker processes
+            kwargs = {'njobs': 2, 'chunksize': 2} if format == 'npy' else {}
+            self.assertEqual(run.run(self.padel, **kwargs), {'shards': 3, 'completed': 3, 'calculated': 3})
+            with open(run.record_path(2)) as handle:
+                self.assertEqual(json.load(handle)['calculated'], len(self.molecules) - 6)
+            values = run.load()
+            self.assertEqual(values.index.tolist(), list(range(len(expected))))
+            self.assertTrue(values.astype(float).equals(expected.astype(float)))
+            # Completed shards are skipped
+            self.assertEqual(run.run(self.padel)['calculated'], 0)
+        # Shards claimed by a live process are skipped, those of dead processes are taken over
+        os.remove(run.record_path(1))
+        with open(run._lock_path(1), 'w') as handle:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, handle)
+        self.assertEqual(run.run(self.padel), {'shards': 3, 'completed': 2, 'calculated': 0})
+        with open(run._lock_path(1), 'w') as handle:
+            json.dump({'host': socket.gethostname(), 'pid': 2 ** 22 + 1}, handle)
+        self.assertEqual(run.run(self.padel), {'shards': 3, 'completed': 3, 'calculated': 1})
+        self.assertFalse(os.path.exists(run._lock_path(1)))
+        # Runs with other parameters cannot share the output directory
+        with self.assertRaises(ValueError):
+            ShardedRun(self.smiles, output_dir, shard_size=2, format='npy').run(self.padel)
+
+    def test_command_line(self):
+        """Test the console entry point."""
+        output_dir = os.path.join(self.dir, 'output')
+        main([self.sd, output_dir, '--descriptors', 'Weight', 'TPSA', '--fingerprints', 'MACCSFP',
+              '--shard-size', '4', '--format', 'npy'])
+        values = ShardedRun(self.sd, output_dir, shard_size=4, format='npy').load()
+        self.assertEqual(len(values), len(self.molecules))
+        self.assertIn('MACCSFP1', values.columns)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Tests for the on-disk descriptor cache."""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from PaDEL_pywrapper import DescriptorCache, PaDEL
+from PaDEL_pywrapper.descriptor import PubchemFP, Weight
+from PaDEL_pywrapper.utils import mktempfile
+from tests.constants import MOLECULES
+
+
+class TestCache(unittest.TestCase):
+    """Tests for PaDEL_pywrapper descriptor cache."""
+    def setUp(self) -> None:
+        """Create an empty cache."""
+        self.path = mktempfile('cache.db')
+        self.molecules = list(MOLECULES.values())
+
+    def tearDown(self) -> None:
+        """Remove the cache."""
+        os.remove(self.path)
+
+    def test_lru_eviction(self):
+        """Test least recently used values are evicted beyond the maximum size."""
+        cache = DescriptorCache(self.path, max_size=3 * 5 * 8)
+        cache.put('config', ['a', 'b', 'c', 'd', 'e'], {'mol1': np.ones(5), 'mol2': np.zeros(5)})
+        cache.get('config', ['mol1'])
+        cache.put('config', ['a', 'b', 'c', 'd', 'e'], {'mol3': np.ones(5), 'mol4': np.ones(5)})
+        self.assertEqual(sorted(cache.get('config', ['mol1', 'mol2', 'mol3', 'mol4'])), ['mol1', 'mol3', 'mol4'])
+        self.assertEqual(cache.stats, {'hits': 4, 'misses': 1, 'evictions': 1})
+        # The size of values is kept up to date as they are replaced or removed
+        self.assertEqual(cache.size, 3 * 5 * 8)
+        cache.put('config', ['a', 'b', 'c', 'd', 'e'], {'mol1': np.zeros(5)})
+        self.assertEqual(cache.size, 3 * 5 * 8)
+        self.assertEqual(cache.stats['evictions'], 1)
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+        cache.close()
+
+    def test_cached_calculation(self):
+        """Test cached values match calculated ones."""
+        expected = PaDEL([Weight, PubchemFP]).calculate(self.molecules, show_banner=False)
+        cache = DescriptorCache(self.path)
+        padel = PaDEL([Weight, PubchemFP], cache=cache)
+        for _ in range(2):
+            values = padel.calculate(self.molecules + [None], show_banner=False)
+            self.assertTrue(np.array_equal(values.values[:-1], expected.values.astype(float)))
+            self.assertTrue(values.iloc[-1].isna().all())
+        self.assertEqual(cache.stats, {'hits': len(MOLECULES), 'misses': len(MOLECULES), 'evictions': 0})
+        cache.close()
+
+    def test_failures_not_cached(self):
+        """Test values of molecules that could not be calculated are not cached."""
+        expected = PaDEL([Weight]).calculate(self.molecules, show_banner=False)
+        cache = DescriptorCache(self.path)
+        padel = PaDEL([Weight], cache=cache)
+        with mock.patch.object(PaDEL, '_calculate', return_value=expected * np.nan):
+            self.assertTrue(padel.calculate(self.molecules, show_banner=False).isna().all().all())
+        values = padel.calculate(self.molecules, show_banner=False)
+        self.assertTrue(np.array_equal(values.values, expected.values.astype(float)))
+        self.assertEqual(cache.stats['hits'], 0)
+        cache.close()
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""Tests for molecular descriptors."""
+
+import asyncio
+import os
+import shutil
+import sys
+import threading
+import unittest
+import warnings
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem
+
+from PaDEL_pywrapper import CalculationStats, PaDEL, SchedulingStats
+from PaDEL_pywrapper.descriptor import AtomCount, FP, TPSA, Weight, _load_metadata
+from PaDEL_pywrapper import padel_wrapper, utils
+from PaDEL_pywrapper.utils import mktempdir, mktempfile
+from tests.constants import MOLECULES
+from tests.java_double import create_java_double
+
+
+class TestDescriptors(unittest.TestCase):
+    """Tests for PaDEL_pywrapper molecular descriptors."""
+    def setUp(self) -> None:
+        """Load molecules."""
+        self.molecules = list(MOLECULES.values())
+
+    def test_selected_descriptors(self):
+        """Test only the selected descriptors are calculated."""
+        descriptors = [Weight, AtomCount, TPSA]
+        padel = PaDEL(descriptors)
+        values = padel.calculate(self.molecules, show_banner=False)
+        expected = [name for desc in descriptors for name in desc.subcomponents]
+        self.assertEqual(values.shape, (len(MOLECULES), len(expected)))
+        self.assertEqual(sorted(values.columns.tolist()), sorted(expected))
+
+    def test_iter_calculate(self):
+        """Test chunks yielded lazily match the values calculated at once."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(self.molecules, show_banner=False)
+        for njobs in [1, 2]:
+            chunks = list(padel.iter_calculate(iter(self.molecules), show_banner=False, njobs=njobs, chunksize=2))
+            self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 2, 1])
+            self.assertEqual(chunks[1].index.tolist(), [2, 3])
+            self.assertTrue(pd.concat(chunks).equals(expected))
+
+    def test_calculate_to_npy(self):
+        """Test values written chunk by chunk to a memory-mapped array match the values calculated at once."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(self.molecules, show_banner=False)
+        path = mktempfile('descriptors.npy')
+        try:
+            columns = padel.calculate_to_file(self.molecules, path, format='npy', show_banner=False, chunksize=2)
+            values = np.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(columns, expected.columns.tolist())
+        self.assertTrue(np.array_equal(values, expected.values, equal_nan=True))
+
+    def test_deduplicate(self):
+        """Test values of deduplicated molecules are scattered back to their original positions."""
+        molecules = self.molecules + [None] + self.molecules[::-1] + [None]
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(molecules, show_banner=False)
+        values = padel.calculate(molecules, show_banner=False, deduplicate=True)
+        self.assertTrue(values.equals(expected))
+        self.assertTrue(values.iloc[len(self.molecules)].isna().all())
+
+    def test_java_threads(self):
+        """Test values calculated by several ePaDEL threads are in input order."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(self.molecules, show_banner=False)
+        values = padel.calculate(self.molecules, show_banner=False, java_threads=4)
+        self.assertTrue(values.equals(expected))
+
+    def test_balanced_schedule(self):
+        """Test values calculated from balanced chunks are in input order and busy time is recorded."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(self.molecules, show_banner=False)
+        stats = SchedulingStats()
+        values = padel.calculate(self.molecules, show_banner=False, njobs=2, chunksize=2, schedule='balanced',
+                                 stats=stats)
+        self.assertTrue(values.equals(expected))
+        self.assertEqual(sum(stats.molecules.values()), len(self.molecules))
+        self.assertEqual(sum(stats.chunks.values()), 4)
+        self.assertGreaterEqual(stats.imbalance, 1.0)
+        values = padel.calculate([], show_banner=False, njobs=2, schedule='balanced')
+        self.assertEqual(values.columns.tolist(), expected.columns.tolist())
+        self.assertEqual(len(values), 0)
+
+    def test_text_dtypes(self):
+        """Test columns parsed from text keep their own data type, integer ones being masked for skipped molecules."""
+        padel = PaDEL([AtomCount, Weight])
+        columns = padel.calculate(self.molecules[:1], show_banner=False).columns
+        row = ' '.join('3' if name in AtomCount.subcomponents else '1.5' for name in columns) + '\n'
+        with mock.patch.object(PaDEL, '_run_values', return_value=(row * 2).encode()):
+            values = padel.calculate(self.molecules[:2], show_banner=False)
+            self.assertEqual(values['nAtom'].dtype, np.int64)
+            self.assertEqual(values['MW'].dtype, np.float64)
+            values = padel.calculate([self.molecules[0], None, self.molecules[1]], show_banner=False)
+            self.assertEqual(values['nAtom'].dtype, 'Int64')
+            self.assertTrue(values.iloc[1].isna().all())
+            self.assertEqual(values['nAtom'].tolist()[::2], [3, 3])
+
+    def test_metadata_loaded_once(self):
+        """Test metadata of descriptors and fingerprints is read once per process."""
+        fingerprints = [FP(size=size) for size in [512, 1024, 2048]]
+        self.assertEqual([fp.nBits for fp in fingerprints], [512, 1024, 2048])
+        self.assertEqual(len({fp.bit_prefix for fp in fingerprints}), 1)
+        self.assertEqual(Weight.subcomponents, ['MW', 'AMW'])
+        self.assertLessEqual(_load_metadata.cache_info().misses, 2)
+
+    def test_names_memoized(self):
+        """Test names of values are obtained from memory or disk once known."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        cache_dir = mktempdir()
+        try:
+            with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_CACHE': cache_dir}), \
+                    mock.patch.dict(padel_wrapper._names, clear=True):
+                expected = padel.calculate(self.molecules, show_banner=False)
+                self.assertEqual(len(padel_wrapper._names), 1)
+                self.assertEqual(len(os.listdir(os.path.join(cache_dir, 'names'))), 1)
+                # Names are read from disk by new processes
+                padel_wrapper._names.clear()
+                with mock.patch.object(padel_wrapper, 'Popen') as popen:
+                    names = padel._run_names(padel._create_command()[0])
+                    popen.assert_not_called()
+                self.assertEqual(names.split(), expected.columns.tolist())
+                # Names depend on the Java runtime
+                command = padel._create_command()[0]
+                key = padel._names_key(command)
+                with mock.patch.object(padel_wrapper, 'java_version', return_value='JAVA_VERSION="0"'):
+                    self.assertNotEqual(padel._names_key(command), key)
+                # Names not matching the values written by ePaDEL are obtained again
+                padel_wrapper._names[key] = 'MW AMW'
+                values = padel.calculate(self.molecules, show_banner=False)
+                self.assertTrue(values.equals(expected))
+                with open(os.path.join(cache_dir, 'names', f'{key}.txt')) as handle:
+                    self.assertEqual(handle.read().split(), expected.columns.tolist())
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_stream_input(self):
+        """Test values of molecules written to the standard input of ePaDEL match those written to a file."""
+        molecules = self.molecules + [None] + self.molecules
+        expected = PaDEL([Weight, AtomCount, TPSA]).calculate(molecules, show_banner=False)
+        for persistent in [False, True]:
+            padel = PaDEL([Weight, AtomCount, TPSA], persistent=persistent, stream_input=True)
+            values = padel.calculate(molecules, show_banner=False)
+            self.assertTrue(values.equals(expected))
+
+    def test_pipeline(self):
+        """Test values calculated by the pipelined engine are in input order."""
+        molecules = self.molecules + [None] + self.molecules
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(molecules, show_banner=False)
+        values = padel.calculate(iter(molecules), show_banner=False, chunksize=2, pipeline=True)
+        self.assertTrue(values.equals(expected))
+        chunks = list(padel.iter_calculate(molecules, show_banner=False, chunksize=5, pipeline=True, max_pending=1))
+        self.assertEqual([chunk.index[0] for chunk in chunks], [0, 5, 10])
+        for kwargs in [{'pipeline': True}, {'njobs': 2}]:
+            values = padel.calculate([], show_banner=False, **kwargs)
+            self.assertEqual(values.columns.tolist(), expected.columns.tolist())
+            self.assertEqual(len(values), 0)
+
+    def test_missing_hydrogens(self):
+        """Test a single warning is raised per batch and hydrogen atoms are added on demand."""
+        molecules = [Chem.RemoveHs(mol) for mol in self.molecules]
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            padel.calculate(molecules + [None], show_banner=False)
+        messages = [str(warning.message) for warning in caught if 'hydrogen' in str(warning.message)]
+        self.assertEqual(len(messages), 1)
+        self.assertIn(f'{len(molecules)} molecule(s)', messages[0])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            values = PaDEL([Weight, AtomCount, TPSA], add_hs=True).calculate(molecules, show_banner=False)
+        self.assertFalse(any('hydrogen' in str(warning.message) for warning in caught))
+        expected = padel.calculate([Chem.AddHs(mol) for mol in molecules], show_banner=False)
+        self.assertTrue(values.equals(expected))
+
+    def test_calculation_stats(self):
+        """Test stages are timed and counters are aggregated across processes."""
+        molecules = self.molecules + [None]
+        stages = []
+        stats = CalculationStats(callback=lambda stage, seconds: stages.append(stage))
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        values = padel.calculate(molecules, show_banner=False, stats=stats)
+        self.assertTrue(values.equals(padel.calculate(molecules, show_banner=False)))
+        self.assertEqual(stats.counters['molecules'], len(self.molecules))
+        self.assertEqual(stats.counters['skipped'], 1)
+        self.assertGreater(stats.counters['bytes_sent'], 0)
+        self.assertGreater(stats.counters['bytes_received'], 0)
+        self.assertTrue({'java_resolution', 'preparation', 'serialization', 'jvm', 'parsing'} <= set(stats.timers))
+        self.assertEqual(set(stages), set(stats.timers))
+        stats = CalculationStats()
+        padel.calculate(molecules, show_banner=False, njobs=2, chunksize=5, stats=stats)
+        self.assertEqual(stats.counters['molecules'], len(self.molecules))
+        self.assertEqual(stats.counters['skipped'], 1)
+        self.assertGreaterEqual(stats.counters['jvm_launches'], 2)
+        self.assertEqual(sum(stats.chunks.values()), 2)
+
+    @unittest.skipIf(sys.platform == 'win32', 'the Java test double is a shell script')
+    def test_jvm_failures(self):
+        """Test molecules following one on which ePaDEL hung or crashed are calculated in a new JVM."""
+        directory = mktempdir()
+        try:
+            # Molecules named HANG or CRASH make the Java test double hang or crash
+            java = create_java_double(directory, utils.install_java())
+            with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_JAVA': java}), \
+                    mock.patch.dict(utils._java_paths, clear=True):
+                for name, kwargs in [('CRASH', {}), ('CRASH', {'output_format': 'binary', 'stream_input': True}),
+                                     ('HANG', {'hang_timeout': 20})]:
+                    culprit = Chem.Mol(self.molecules[2])
+                    culprit.SetProp('_Name', name)
+                    molecules = self.molecules[:2] + [None, culprit] + self.molecules[3:]
+                    padel = PaDEL([Weight, AtomCount, TPSA], **kwargs)
+                    expected = padel.calculate(self.molecules[:2] + [None] + self.molecules[2:], show_banner=False)
+                    stats = CalculationStats()
+                    with warnings.catch_warnings(record=True) as caught:
+                        warnings.simplefilter('always')
+                        values = padel.calculate(molecules, show_banner=False, stats=stats)
+                    self.assertTrue(any('molecule 3 of the batch' in str(warning.message) for warning in caught))
+                    self.assertEqual(stats.counters['jvm_failures'], 1)
+                    self.assertEqual(stats.counters['jvm_launches'], 2)
+                    self.assertTrue(values.iloc[3].isna().all())
+                    # Integer values become floating point with NaN values
+                    pd.testing.assert_frame_equal(values.drop(index=3), expected.drop(index=3), check_dtype=False)
+        finally:
+            shutil.rmtree(directory)
+        # Values cut short by a JVM exiting normally
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        expected = padel.calculate(self.molecules, show_banner=False)
+        launch = padel._launch_jvm
+
+        def truncate(command, molecules, retry=False):
+            values, error = launch(command, molecules, retry)
+            return (values if retry else values[:values.index(b'\n') + 1]), error
+
+        with mock.patch.object(padel, '_launch_jvm', truncate), warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            values = padel.calculate(self.molecules, show_banner=False)
+        self.assertTrue(any('molecule 1 of the batch' in str(warning.message) for warning in caught))
+        self.assertTrue(values.iloc[1].isna().all())
+        pd.testing.assert_frame_equal(values.drop(index=1), expected.drop(index=1), check_dtype=False)
+        with self.assertRaises(ValueError):
+            PaDEL([Weight], timeout=0)
+
+    def test_java_resolution(self):
+        """Test Java is resolved once per process and recorded on disk for other processes."""
+        cache_dir = mktempdir()
+        try:
+            with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_CACHE': cache_dir}), \
+                    mock.patch.dict(utils._java_paths, clear=True), \
+                    mock.patch.object(utils, 'get_java_in_dir', wraps=utils.get_java_in_dir) as search:
+                os.environ.pop('PADEL_PYWRAPPER_JAVA', None)
+                java = utils.install_java()
+                self.assertEqual(utils.install_java(), java)
+                self.assertEqual(search.call_count, 1)
+                self.assertTrue(os.path.isfile(os.path.join(cache_dir, 'java.json')))
+                # Other processes read the record
+                utils._java_paths.clear()
+                self.assertEqual(utils.install_java(), java)
+                self.assertEqual(search.call_count, 1)
+                # Explicit Java home
+                utils._java_paths.clear()
+                with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_JAVA': os.path.dirname(os.path.dirname(java))}):
+                    self.assertEqual(utils.install_java(), java)
+                    PaDEL([Weight]).warm_up()
+                self.assertEqual(search.call_count, 1)
+                utils._java_paths.clear()
+                with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_JAVA': os.path.join(cache_dir, 'java')}):
+                    with self.assertRaises(ValueError):
+                        utils.install_java()
+                # Java given to warm_up is used by the instance only
+                padel = PaDEL([Weight])
+                padel.warm_up(java=os.path.dirname(os.path.dirname(java)))
+                self.assertEqual(padel._resolve_java(), java)
+                self.assertNotIn('PADEL_PYWRAPPER_JAVA', os.environ)
+                with self.assertRaises(ValueError):
+                    PaDEL([Weight]).warm_up(java=os.path.join(cache_dir, 'java'))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    @unittest.skipIf(sys.platform == 'win32', 'the Java test double is a shell script')
+    def test_acalculate(self):
+        """Test concurrent asynchronous requests are coalesced and can be cancelled."""
+        padel = PaDEL([Weight, AtomCount, TPSA], max_jvms=1)
+        requests = [self.molecules[:2] + [None], self.molecules[2:4], [], self.molecules[4:]]
+        expected = [padel.calculate(molecules, show_banner=False) for molecules in requests]
+
+        async def gather():
+            return await asyncio.gather(*[padel.acalculate(molecules, show_banner=False) for molecules in requests])
+
+        with mock.patch('asyncio.create_subprocess_exec', wraps=asyncio.create_subprocess_exec) as launch:
+            results = asyncio.run(gather())
+        # Requests submitted together are coalesced into a single run
+        self.assertEqual(launch.call_count, 1)
+        for values, expected_values in zip(results, expected):
+            self.assertTrue(values.equals(expected_values))
+
+        # Molecules streamed to ePaDEL are serialized outside of the event loop
+        streaming = PaDEL([Weight, AtomCount, TPSA], stream_input=True)
+        read_molecules, threads = PaDEL._read_molecules, []
+
+        def read(self):
+            threads.append(threading.current_thread())
+            return read_molecules(self)
+
+        with mock.patch.object(PaDEL, '_read_molecules', read):
+            values = asyncio.run(streaming.acalculate(self.molecules, show_banner=False))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertTrue(values.equals(streaming.calculate(self.molecules, show_banner=False)))
+
+        culprit = Chem.Mol(self.molecules[0])
+        culprit.SetProp('_Name', 'HANG')
+
+        async def cancel():
+            task = asyncio.ensure_future(padel.acalculate([culprit], show_banner=False))
+            await asyncio.sleep(2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await padel.acalculate(self.molecules, show_banner=False)
+
+        processes, paths = [], []
+
+        async def launch(*args, **kwargs):
+            processes.append(await create_subprocess_exec(*args, **kwargs))
+            return processes[-1]
+
+        def tempfile(*args):
+            paths.append(mktempfile(*args))
+            return paths[-1]
+
+        create_subprocess_exec = asyncio.create_subprocess_exec
+        directory = mktempdir()
+        try:
+            # Molecules named HANG make the Java test double hang
+            java = create_java_double(directory, utils.install_java())
+            with mock.patch.dict(os.environ, {'PADEL_PYWRAPPER_JAVA': java}), \
+                    mock.patch.dict(utils._java_paths, clear=True), \
+                    mock.patch('asyncio.create_subprocess_exec', launch), \
+                    mock.patch.object(padel_wrapper, 'mktempfile', tempfile):
+                values = asyncio.run(cancel())
+        finally:
+            shutil.rmtree(directory)
+        self.assertTrue(values.equals(padel.calculate(self.molecules, show_banner=False)))
+        # The hung JVM was killed and temporary files removed
+        self.assertEqual(len(processes), 2)
+        self.assertIsNotNone(processes[0].returncode)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        with self.assertRaises(ValueError):
+            asyncio.run(PaDEL([Weight], hang_timeout=10).acalculate(self.molecules, show_banner=False))
+
+    def test_conformers(self):
+        """Test 3D descriptors of conformer-less molecules embedded in worker processes."""
+        from PaDEL_pywrapper.descriptor import WHIM
+        from PaDEL_pywrapper import conformers
+
+        flat = [Chem.Mol(mol) for mol in self.molecules]
+        for mol in flat:
+            mol.RemoveAllConformers()
+        with self.assertRaises(ValueError):
+            PaDEL([Weight, WHIM], ignore_3D=False).calculate(flat[:2], show_banner=False)
+        generator = conformers.ConformerGenerator(n_conformers=2, seed=7)
+        padel = PaDEL([Weight, WHIM], ignore_3D=False, conformers=generator)
+        molecules = flat[:3] + [None] + flat[:2]
+        stats = CalculationStats()
+        with mock.patch.dict(conformers._geometries, clear=True):
+            values = padel.calculate(molecules, show_banner=False, stats=stats)
+            # Identical structures are embedded once
+            self.assertEqual(len(conformers._geometries), 3)
+        self.assertIn('embedding', stats.timers)
+        self.assertTrue(values.iloc[3].isna().all())
+        self.assertTrue(values.iloc[4:].reset_index(drop=True).equals(values.iloc[:2]))
+        # Geometries do not depend on the process embedding molecules nor on the order of atoms
+        self.assertTrue(values.equals(padel.calculate(molecules, show_banner=False, njobs=2, chunksize=2)))
+        embedded = generator.embed(flat[1])
+        shuffled = generator.embed(Chem.RenumberAtoms(flat[1], list(range(flat[1].GetNumAtoms()))[::-1]))
+        self.assertTrue(np.allclose(embedded.GetConformer().GetPositions(), shuffled.GetConformer().GetPositions()))
+        # Molecules that cannot be embedded are skipped
+        with mock.patch.object(conformers.ConformerGenerator, '_embed', return_value=None), \
+                mock.patch.dict(conformers._geometries, clear=True), \
+                warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            values = padel.calculate(flat[:2], show_banner=False)
+        self.assertTrue(values.isna().all().all())
+        self.assertTrue(any('could not be embedded' in str(warning.message) for warning in caught))
+
+    def test_calculate_file(self):
+        """Test molecules of files and SMILES are parsed by the processes calculating them."""
+        padel = PaDEL([Weight, AtomCount, TPSA])
+        directory = mktempdir()
+        try:
+            sd = os.path.join(directory, 'molecules.sdf')
+            with Chem.SDWriter(sd) as writer:
+                for mol in self.molecules:
+                    writer.write(mol)
+            expected = padel.calculate(self.molecules, show_banner=False)
+            for njobs in [1, 2]:
+                # Records with hydrogen atoms are not serialized again
+                with mock.patch.object(PaDEL, '_write_molecules') as write:
+                    values = padel.calculate_file(sd, show_banner=False, njobs=njobs, chunksize=3)
+                write.assert_not_called()
+                self.assertTrue(values.equals(expected))
+            smiles = [Chem.MolToSmiles(Chem.RemoveHs(mol)) for mol in self.molecules]
+            path = os.path.join(directory, 'molecules.smi')
+            with open(path, 'w') as handle:
+                handle.write('\n'.join(f'{line} name' for line in smiles[:3] + ['C1CC'] + smiles[3:]) + '\n\n')
+            expected = padel.calculate([Chem.AddHs(Chem.MolFromSmiles(line)) for line in smiles[:3]] + [None] +
+                                       [Chem.AddHs(Chem.MolFromSmiles(line)) for line in smiles[3:]],
+                                       show_banner=False)
+            stats = CalculationStats()
+            self.assertTrue(padel.calculate_file(path, show_banner=False, njobs=2, chunksize=3,
+                                                 stats=stats).equals(expected))
+            self.assertEqual(stats.counters['skipped'], 1)
+            self.assertIn('reading', stats.timers)
+            for njobs in [1, 2]:
+                values = padel.calculate_smiles(iter(smiles[:3] + ['C1CC'] + smiles[3:]), show_banner=False,
+                                                njobs=njobs, chunksize=3)
+                self.assertTrue(values.equals(expected))
+        finally:
+            shutil.rmtree(directory)
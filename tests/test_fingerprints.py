@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 """Tests for molecular fingerprints."""
 
+import importlib.util
 import unittest
 
+import numpy as np
+
 from PaDEL_pywrapper import PaDEL, descriptors
-from PaDEL_pywrapper.descriptor import _fingerprints
+from PaDEL_pywrapper.descriptor import FP, AtomCount, PubchemFP, SubstructureFPCount, Weight, _fingerprints
 from tests.constants import MOLECULES
 
 
@@ -33,6 +36,21 @@ class TestFingerprints(unittest.TestCase):
             self.assertEqual(len(values.columns.unique().tolist()), self.fp_lens.get(fp_type.short_name, 1024))
             self.assertFalse(values.isna().any().any())
 
+    def test_duplicate_fingerprints(self):
+        """Test fingerprints whose values would share names cannot be requested together."""
+        for fingerprints in [[FP(size=512), FP(size=1024)], [PubchemFP, PubchemFP]]:
+            with self.assertRaises(ValueError):
+                PaDEL([Weight] + fingerprints)
+        values = PaDEL([FP(size=512), PubchemFP]).calculate(self.molecules, show_banner=False)
+        self.assertEqual(values.shape, (len(MOLECULES), 512 + 881))
+
+    def test_fingerprints_with_descriptors(self):
+        """Test fingerprints calculated in the same pass as descriptors and other fingerprints match single runs."""
+        values = PaDEL([Weight, AtomCount] + _fingerprints).calculate(self.molecules, show_banner=False)
+        for fp_type in _fingerprints:
+            expected = PaDEL([fp_type]).calculate(self.molecules, show_banner=False)
+            self.assertTrue(values[expected.columns].equals(expected))
+
     def test_fingerprint_multithread(self):
         """Test the dimensions of the output fingerprint dataframes calculated by different processes."""
         for fp_type in _fingerprints:
@@ -42,3 +60,69 @@ class TestFingerprints(unittest.TestCase):
             self.assertEqual(values.shape, (len(MOLECULES), self.fp_lens.get(fp_type.short_name, 1024)))
             self.assertEqual(len(values.columns.unique().tolist()), self.fp_lens.get(fp_type.short_name, 1024))
             self.assertFalse(values.isna().any().any())
+
+    def test_fingerprint_persistent(self):
+        """Test the fingerprints obtained from a persistent ePaDEL server match those of single runs."""
+        for fp_type in _fingerprints:
+            expected = PaDEL([fp_type]).calculate(self.molecules, show_banner=False)
+            padel = PaDEL([fp_type], persistent=True)
+            for _ in range(2):
+                values = padel.calculate(self.molecules, show_banner=False)
+                self.assertTrue(values.equals(expected))
+
+    def test_fingerprint_binary(self):
+        """Test the fingerprints obtained from the binary output of ePaDEL match those of the text output."""
+        for fp_type in _fingerprints:
+            expected = PaDEL([fp_type]).calculate(self.molecules, show_banner=False)
+            values = PaDEL([fp_type], output_format='binary').calculate(self.molecules, show_banner=False)
+            self.assertEqual(values.shape, expected.shape)
+            self.assertEqual(values.columns.tolist(), expected.columns.tolist())
+            self.assertTrue((values.values == expected.values).all())
+
+    @unittest.skipIf(importlib.util.find_spec('scipy') is None, 'scipy is not installed')
+    def test_fingerprint_compact(self):
+        """Test packed and sparse fingerprints match dense fingerprints."""
+        molecules = self.molecules + [None]
+        padel = PaDEL([Weight] + _fingerprints)
+        expected = padel.calculate(molecules, show_banner=False)
+        for fingerprint_format in ['packed', 'sparse']:
+            for njobs in [1, 2]:
+                values, fingerprints = padel.calculate(molecules, show_banner=False, njobs=njobs, chunksize=3,
+                                                       fingerprint_format=fingerprint_format)
+                self.assertTrue(values.equals(expected[values.columns]))
+                for fp_type in _fingerprints:
+                    dense = expected.filter(regex=f'^{fp_type.bit_prefix}\\d+$')
+                    n_bits = self.fp_lens.get(fp_type.short_name, 1024)
+                    self.assertEqual(dense.columns.tolist(), [f'{fp_type.bit_prefix}{i}' for i in range(1, n_bits + 1)])
+                    dense = dense.fillna(0).values
+                    fp = fingerprints[fp_type.bit_prefix]
+                    if fp_type.is_count:
+                        self.assertEqual(fp.dtype, np.int32)
+                        self.assertTrue((fp.toarray() == dense).all())
+                    elif fingerprint_format == 'sparse':
+                        self.assertEqual(fp.dtype, bool)
+                        self.assertTrue((fp.toarray() == (dense != 0)).all())
+                    else:
+                        self.assertEqual(fp.dtype, np.uint8)
+                        unpacked = np.unpackbits(fp, axis=1, count=dense.shape[1])
+                        self.assertTrue((unpacked == (dense != 0)).all())
+        values, fingerprints = padel.calculate([], show_banner=False, njobs=2, fingerprint_format='sparse')
+        self.assertEqual(len(values), 0)
+        self.assertEqual(fingerprints['PubchemFP'].shape, (0, 881))
+
+    def test_compact_dtypes(self):
+        """Test values are assembled with the requested data types and skipped molecules are masked."""
+        molecules = [None] + self.molecules + [None]
+        fingerprints = [PubchemFP, SubstructureFPCount]
+        expected = PaDEL([Weight] + fingerprints).calculate(molecules, show_banner=False)
+        for output_format in ['text', 'binary']:
+            padel = PaDEL([Weight] + fingerprints, output_format=output_format, dtypes=PaDEL.COMPACT_DTYPES)
+            values = padel.calculate(molecules, show_banner=False)
+            self.assertEqual(values.shape, expected.shape)
+            self.assertEqual(values['MW'].dtype, np.float32)
+            self.assertEqual(values['PubchemFP1'].dtype, 'UInt8')
+            self.assertEqual(values['SubFPC1'].dtype, 'UInt16')
+            self.assertTrue(values.iloc[[0, -1]].isna().all().all())
+            self.assertFalse(values.iloc[1:-1].isna().any().any())
+            self.assertTrue(np.allclose(values.to_numpy(dtype=float, na_value=np.nan),
+                                        expected.to_numpy(dtype=float, na_value=np.nan), equal_nan=True))